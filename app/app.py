@@ -1,16 +1,19 @@
 from flask import Flask, render_template, request, redirect, session
-from datetime import datetime
+from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from pytz import timezone as pytz_timezone
 import sqlite3
-import smtplib
 from email.mime.text import MIMEText
 import os
+import json
 import requests
 import re
+import time
 from functools import wraps
 from flask_wtf.csrf import CSRFError, CSRFProtect, generate_csrf
+from db import get_db, init_app as init_db_pool, pool
+from mailer import transport as mail_transport
 
 
 app = Flask(__name__)
@@ -19,6 +22,9 @@ app.secret_key = 'your_secret_key_here'  # Replace with a secure key
 # Enable CSRF protection
 csrf = CSRFProtect(app)
 
+# Pooled SQLite connections, returned at the end of each request
+init_db_pool(app)
+
 # Custom CSRF error handler
 @app.errorhandler(CSRFError)
 def handle_csrf_error(e):
@@ -26,25 +32,87 @@ def handle_csrf_error(e):
 
 # Initialize database
 def init_db():
-    conn = sqlite3.connect('licenses.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS licenses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        expiry_date TEXT,
-        email TEXT,
-        owner_name TEXT,
-        last_updated_by TEXT,
-        last_updated_on TEXT
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE,
-        password TEXT,
-        role TEXT
-    )''')
-    conn.commit()
-    conn.close()
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS licenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            expiry_date TEXT,
+            email TEXT,
+            owner_name TEXT,
+            last_updated_by TEXT,
+            last_updated_on TEXT
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            password TEXT,
+            role TEXT
+        )''')
+
+        # Indexes for the expiry filters, the admin count and the case-insensitive login lookup
+        c.execute("CREATE INDEX IF NOT EXISTS idx_licenses_expiry_date ON licenses(expiry_date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(LOWER(username))")
+
+        init_search_index(c)
+        normalize_expiry_dates(c)
+        conn.commit()
+
+# Migration: the expiry filters compare ISO strings, so rewrite dates stored
+# before they were normalised ('2026-1-5' -> '2026-01-05')
+def normalize_expiry_dates(c):
+    c.execute("SELECT id, expiry_date FROM licenses WHERE expiry_date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'")
+    for license_id, expiry in c.fetchall():
+        if expiry and is_valid_date(expiry):
+            c.execute("UPDATE licenses SET expiry_date = ? WHERE id = ?", (normalize_date(expiry), license_id))
+
+# Full-text search over licenses(name, owner_name). The trigram tokenizer
+# (SQLite 3.34+) matches case-insensitive substrings, like the old LIKE '%q%'.
+FTS_MIN_QUERY_LENGTH = 3
+fts_enabled = False
+
+def init_search_index(c):
+    global fts_enabled
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'licenses_fts'")
+    exists = c.fetchone() is not None
+    try:
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS licenses_fts USING fts5(
+            name, owner_name,
+            content='licenses', content_rowid='id', tokenize='trigram'
+        )''')
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 trigram search unavailable, falling back to LIKE: {e}")
+        return
+
+    # Keep the index in sync with every write to licenses
+    c.execute('''CREATE TRIGGER IF NOT EXISTS licenses_fts_insert AFTER INSERT ON licenses BEGIN
+        INSERT INTO licenses_fts(rowid, name, owner_name) VALUES (new.id, new.name, new.owner_name);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS licenses_fts_delete AFTER DELETE ON licenses BEGIN
+        INSERT INTO licenses_fts(licenses_fts, rowid, name, owner_name) VALUES ('delete', old.id, old.name, old.owner_name);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS licenses_fts_update AFTER UPDATE OF name, owner_name ON licenses BEGIN
+        INSERT INTO licenses_fts(licenses_fts, rowid, name, owner_name) VALUES ('delete', old.id, old.name, old.owner_name);
+        INSERT INTO licenses_fts(rowid, name, owner_name) VALUES (new.id, new.name, new.owner_name);
+    END''')
+
+    # Migration: index the rows written before the search table existed
+    if not exists:
+        c.execute("INSERT INTO licenses_fts(licenses_fts) VALUES ('rebuild')")
+    fts_enabled = True
+
+def search_licenses(c, query):
+    if fts_enabled and len(query) >= FTS_MIN_QUERY_LENGTH:
+        # Quoted as a single phrase so the query is matched literally
+        phrase = '"' + query.replace('"', '""') + '"'
+        c.execute('''SELECT licenses.* FROM licenses_fts
+                     JOIN licenses ON licenses.id = licenses_fts.rowid
+                     WHERE licenses_fts MATCH ?
+                     ORDER BY licenses.id''', (phrase,))
+    else:
+        c.execute("SELECT * FROM licenses WHERE LOWER(name) LIKE ? OR LOWER(owner_name) LIKE ?", (f'%{query}%', f'%{query}%'))
+    return c.fetchall()
 
 def is_valid_username(username):
     # Accepts email-style usernames
@@ -78,6 +146,10 @@ def is_valid_date(date_str):
     except ValueError:
         return False
 
+def normalize_date(date_str):
+    # Zero-padded ISO form, which the SQL date filters rely on
+    return datetime.strptime(date_str, "%Y-%m-%d").date().isoformat()
+
 # Email reminders
 def send_email(to, subject, body):
     sender = os.getenv("EMAIL_USER")
@@ -90,29 +162,59 @@ def send_email(to, subject, body):
     msg['From'] = sender
     msg['To'] = to
     try:
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(sender, password)
-            server.send_message(msg)
+        mail_transport.send(msg)
         print(f"Email successfully sent to {to}")
     except Exception as e:
         print(f"Email error: {e}")
 
-def send_teams_message(name, expiry, days_left, owner):
+# Teams webhook: one keep-alive session, alerts grouped into cards under the ~28 KB payload limit
+TEAMS_MAX_PAYLOAD_BYTES = int(os.getenv("TEAMS_MAX_PAYLOAD_BYTES", "20000"))
+TEAMS_MAX_RETRIES = int(os.getenv("TEAMS_MAX_RETRIES", "5"))
+teams_session = requests.Session()
+
+def teams_line(name, expiry, days_left, owner):
+    return f"📄 `{name}` expires in **{days_left} days** — 📅 `{expiry}` — 👤 @`{owner}`"
+
+def teams_cards(lines):
+    card, size = [], 0
+    for line in lines:
+        line_size = len(line.encode('utf-8')) + 2
+        if card and size + line_size > TEAMS_MAX_PAYLOAD_BYTES:
+            yield card
+            card, size = [], 0
+        card.append(line)
+        size += line_size
+    if card:
+        yield card
+
+def post_teams(webhook_url, payload):
+    # Retries 429s, waiting as long as Retry-After asks (exponential backoff otherwise)
+    # Sent as raw UTF-8 so the size limit is not blown by escaped emoji
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    delay = 1
+    for attempt in range(TEAMS_MAX_RETRIES + 1):
+        response = teams_session.post(
+            webhook_url, data=body, headers={'Content-Type': 'application/json'}, timeout=10
+        )
+        if response.status_code != 429 or attempt == TEAMS_MAX_RETRIES:
+            return response
+        try:
+            wait = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            wait = delay
+        print(f"Teams throttled, retrying in {wait}s")
+        time.sleep(wait)
+        delay *= 2
+
+def send_teams_alerts(lines):
     webhook_url = os.getenv("TEAMS_WEBHOOK")
-    message = (
-        f"🔔 **License Alert**\n"
-        f"📄 `{name}` expires in **{days_left} days**\n"
-        f"📅 Expiry Date: `{expiry}`\n"
-        f"👤 Owner: @`{owner}`\n"
-        f"📬 Please renew ASAP."
-    )
-    payload = {"text": message}
-    try:
-        response = requests.post(webhook_url, json=payload)
-        print(f"Teams response: {response.status_code}")
-    except Exception as e:
-        print(f"Teams error: {e}")
+    for card in teams_cards(lines):
+        message = f"🔔 **License Alerts ({len(card)})**\n\n" + "\n\n".join(card) + "\n\n📬 Please renew ASAP."
+        try:
+            response = post_teams(webhook_url, {"text": message})
+            print(f"Teams response for {len(card)} alerts: {response.status_code}")
+        except Exception as e:
+            print(f"Teams error: {e}")
 
 # Admin-only route 
 def admin_required(f):
@@ -128,35 +230,58 @@ def admin_required(f):
     return decorated_function
 
 
+# Reminder days before expiry, and the dashboard's "expiring soon" window
+REMINDER_DAYS = (45, 30, 15, 7, 1)
+EXPIRING_SOON_DAYS = 30
+
+def due_licenses(c, today):
+    # Only the rows due today: the target dates are computed once in SQL,
+    # so the lookup is an IN (...) probe of idx_licenses_expiry_date
+    targets = ', '.join(f"date(:today, '+{days} days')" for days in REMINDER_DAYS)
+    c.execute(f"""
+        SELECT name, expiry_date, email, owner_name,
+               CAST(julianday(expiry_date) - julianday(:today) AS INTEGER) AS days_left
+        FROM licenses
+        WHERE expiry_date IN ({targets})
+    """, {'today': today.isoformat()})
+    return c.fetchall()
+
+def count_expiring_soon(c, today):
+    c.execute("""
+        SELECT COUNT(*) FROM licenses
+        WHERE expiry_date <= date(:today, :window) AND julianday(expiry_date) IS NOT NULL
+    """, {'today': today.isoformat(), 'window': f'+{EXPIRING_SOON_DAYS} days'})
+    return c.fetchone()[0]
+
 def check_expirations():
     print(f"[{datetime.now()}] Running expiration check...")
     today = datetime.today().date()
-    conn = sqlite3.connect('licenses.db')
-    c = conn.cursor()
-    c.execute("SELECT name, expiry_date, email, owner_name FROM licenses")
-    for name, expiry_str, email, owner in c.fetchall():
-        try:
-            expiry = datetime.strptime(expiry_str, "%Y-%m-%d").date()
-            days_left = (expiry - today).days
-            print(f"Evaluating: {name} — {expiry} — {days_left} days left")
-            if days_left in [45, 30, 15, 7, 1]:
-                # Email (if SMTP works)
-                send_email(
-                    email,
-                    f"License '{name}' expires in {days_left} days",
-                    f"Your license '{name}' expires on {expiry}. Please renew."
-                )
-
-                # Teams alert
-                send_teams_message(
-                    name=name,
-                    expiry=expiry,
-                    days_left=days_left,
-                    owner=owner or "Unknown"
-                )
-        except Exception as e:
-            print(f"Reminder error: {e}")
-    conn.close()
+    # Release the connection before any network work
+    with pool.connection() as conn:
+        rows = due_licenses(conn.cursor(), today)
+    print(f"{len(rows)} licenses due for a reminder")
+    # One SMTP session for the whole run instead of a handshake per reminder
+    with mail_transport.session():
+        for row in rows:
+            send_reminder(*row)
+
+    # Teams alerts go out together, a few cards per run
+    send_teams_alerts([
+        teams_line(name, expiry, days_left, owner or "Unknown")
+        for name, expiry, email, owner, days_left in rows
+    ])
+
+def send_reminder(name, expiry, email, owner, days_left):
+    try:
+        print(f"Evaluating: {name} — {expiry} — {days_left} days left")
+        # Email (if SMTP works)
+        send_email(
+            email,
+            f"License '{name}' expires in {days_left} days",
+            f"Your license '{name}' expires on {expiry}. Please renew."
+        )
+    except Exception as e:
+        print(f"Reminder error: {e}")
 
 # Scheduler setup for 10:15 AM Bangladesh time
 bd_tz = pytz_timezone('Asia/Dhaka')
@@ -182,7 +307,7 @@ def auth():
         if not is_valid_password(password):
             return render_template('auth.html', error="Invalid password", source=action, csrf_token=generate_csrf())
 
-        conn = sqlite3.connect('licenses.db')
+        conn = get_db()
         c = conn.cursor()
 
         if action == 'signup':
@@ -192,17 +317,14 @@ def auth():
             try:
                 c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, password, role))
                 conn.commit()
-                conn.close()
                 return redirect('/auth')
             except sqlite3.IntegrityError:
-                conn.close()
                 return render_template('auth.html', error="Username already exists", source="signup", csrf_token=generate_csrf())
 
         elif action == 'login':
             # Normalize username for case-insensitive match
             c.execute("SELECT username, password, role FROM users WHERE LOWER(username) = LOWER(?)", (username,))
             user_record = c.fetchone()
-            conn.close()
 
             if user_record:
                 db_username, db_password, db_role = user_record
@@ -228,20 +350,22 @@ def dashboard():
         return redirect('/auth')
 
     query = request.args.get('query', '').strip().lower()
-    conn = sqlite3.connect('licenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     if query:
-        c.execute("SELECT * FROM licenses WHERE LOWER(name) LIKE ? OR LOWER(owner_name) LIKE ?", (f'%{query}%', f'%{query}%'))
+        licenses = search_licenses(c, query)
     else:
         c.execute("SELECT * FROM licenses")
-    licenses = c.fetchall()
+        licenses = c.fetchall()
 
     today = datetime.today().date()
-    expiring_soon = sum(
-        1 for lic in licenses
-        if lic[2] and (datetime.strptime(lic[2], "%Y-%m-%d").date() - today).days <= 30
-    )
+    if query:
+        # ISO dates compare as strings, so no per-row parsing is needed
+        cutoff = (today + timedelta(days=EXPIRING_SOON_DAYS)).isoformat()
+        expiring_soon = sum(1 for lic in licenses if lic[2] and lic[2] <= cutoff)
+    else:
+        expiring_soon = count_expiring_soon(c, today)
 
     c.execute("SELECT username, role FROM users WHERE username != ?", (session['user'],))
     users = c.fetchall()
@@ -249,7 +373,6 @@ def dashboard():
     c.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
     admin_count = c.fetchone()[0]
 
-    conn.close()
     return render_template('dashboard.html',
                            licenses=licenses,
                            users=users,
@@ -275,12 +398,12 @@ def add():
         return "Invalid email format", 400
     if not is_valid_date(expiry):
         return "Invalid date format", 400
+    expiry = normalize_date(expiry)
 
-    conn = sqlite3.connect('licenses.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("INSERT INTO licenses (name, expiry_date, email, owner_name) VALUES (?, ?, ?, ?)", (name, expiry, email, owner_name))
     conn.commit()
-    conn.close()
     return redirect('/dashboard')
 
 
@@ -292,13 +415,13 @@ def update(license_id):
     new_expiry = request.form['new_expiry'].strip()
     if not is_valid_date(new_expiry):
         return "Invalid date format", 400
+    new_expiry = normalize_date(new_expiry)
 
-    conn = sqlite3.connect('licenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("SELECT id FROM licenses WHERE id = ?", (license_id,))
     if not c.fetchone():
-        conn.close()
         return "License not found", 404
 
     user = session['user']
@@ -311,7 +434,6 @@ def update(license_id):
     """, (new_expiry, user, now, license_id))
 
     conn.commit()
-    conn.close()
     return redirect('/dashboard')
 
 @app.route('/delete/<int:license_id>', methods=['POST'])
@@ -320,17 +442,15 @@ def delete(license_id):
     if 'user' not in session:
         return redirect('/auth')
 
-    conn = sqlite3.connect('licenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("SELECT id FROM licenses WHERE id = ?", (license_id,))
     if not c.fetchone():
-        conn.close()
         return "License not found", 404
 
     c.execute("DELETE FROM licenses WHERE id = ?", (license_id,))
     conn.commit()
-    conn.close()
     return redirect('/dashboard')
 
 @app.route('/promote/<username>', methods=['POST'])
@@ -343,23 +463,20 @@ def promote(username):
     if not is_valid_username(username):
         return "Invalid username", 400
 
-    conn = sqlite3.connect('licenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("SELECT username FROM users WHERE username = ?", (username,))
     if not c.fetchone():
-        conn.close()
         return "User not found", 404
 
     c.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
     admin_count = c.fetchone()[0]
     if admin_count >= 2:
-        conn.close()
         return "Maximum number of admins reached", 403
 
     c.execute("UPDATE users SET role = 'admin' WHERE username = ?", (username,))
     conn.commit()
-    conn.close()
     return redirect('/dashboard')
 
 
@@ -373,18 +490,16 @@ def transfer_admin(username):
     if not is_valid_username(username):
         return "Invalid username", 400
 
-    conn = sqlite3.connect('licenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("SELECT username FROM users WHERE username = ?", (username,))
     if not c.fetchone():
-        conn.close()
         return "User not found", 404
 
     c.execute("UPDATE users SET role = 'admin' WHERE username = ?", (username,))
     c.execute("UPDATE users SET role = 'general' WHERE username = ?", (session['user'],))
     conn.commit()
-    conn.close()
 
     session['role'] = 'general'
     return redirect('/dashboard')
@@ -401,17 +516,15 @@ def delete_user(username):
     if not is_valid_username(username):
         return "Invalid username", 400
 
-    conn = sqlite3.connect('licenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("SELECT username FROM users WHERE username = ?", (username,))
     if not c.fetchone():
-        conn.close()
         return "User not found", 404
 
     c.execute("DELETE FROM users WHERE username = ?", (username,))
     conn.commit()
-    conn.close()
     return redirect('/dashboard')
 
 
@@ -0,0 +1,81 @@
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+from flask import g
+
+DATABASE = os.getenv("DATABASE_PATH", "licenses.db")
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Prepared statements kept per pooled connection, so they survive across requests
+STATEMENT_CACHE_SIZE = 128
+
+
+class ConnectionPool:
+    # Small pool of SQLite connections in WAL mode, shared by request threads
+    def __init__(self, database, size):
+        self.database = database
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        # WAL lets readers proceed while a writer is active
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, conn):
+        # Anything left uncommitted is discarded before the connection is reused
+        try:
+            conn.rollback()
+            self.idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        # For work outside a request, e.g. the scheduled reminder job
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+pool = ConnectionPool(DATABASE, POOL_SIZE)
+
+
+# Request-scoped connection, returned to the pool at app-context teardown
+def get_db():
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,91 @@
+import os
+import smtplib
+import threading
+from contextlib import contextmanager
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+# Set SMTP_STARTTLS=0 for a plain local relay, e.g. the benchmark's stand-in server
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Providers cap messages per connection, so long runs open a fresh session after this many
+SMTP_MAX_MESSAGES = int(os.getenv("SMTP_MAX_MESSAGES", "90"))
+
+
+def is_dropped(error):
+    # Errors after which the connection is dropped and the message retried once on a new one;
+    # 421 is the server announcing it is closing the channel
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code == 421
+
+
+class SMTPTransport:
+    # One authenticated SMTP session, reused for every message sent while it is open
+    def __init__(self, host, port, starttls=True):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.server = None
+        self.sent = 0
+        self.depth = 0
+        self.lock = threading.RLock()
+
+    def connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.starttls:
+                server.starttls()
+            sender, password = os.getenv("EMAIL_USER"), os.getenv("EMAIL_PASS")
+            if password:
+                server.login(sender, password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def disconnect(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                self.server.close()
+        self.server = None
+        self.sent = 0
+
+    def send(self, msg):
+        with self.lock:
+            if self.server is not None and self.sent >= SMTP_MAX_MESSAGES:
+                self.disconnect()
+            for attempt in range(2):
+                if self.server is None:
+                    self.server = self.connect()
+                try:
+                    self.server.send_message(msg)
+                    break
+                except (smtplib.SMTPException, OSError) as e:
+                    if not is_dropped(e):
+                        raise
+                    self.disconnect()
+                    if attempt:
+                        raise
+            self.sent += 1
+            # Outside a session() block the connection is not kept
+            if not self.depth:
+                self.disconnect()
+
+    @contextmanager
+    def session(self):
+        # Keeps the connection open across send() calls, e.g. for a whole reminder run
+        with self.lock:
+            self.depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.depth -= 1
+                if not self.depth:
+                    self.disconnect()
+
+
+transport = SMTPTransport(SMTP_HOST, SMTP_PORT, SMTP_STARTTLS)
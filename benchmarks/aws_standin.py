@@ -0,0 +1,937 @@
+"""In-memory DynamoDB and SNS stand-in for the offline benchmarks.
+
+Answers botocore calls from a before-call hook, after the request has been
+serialised and before anything touches the network, so handlers run their real
+boto3 code paths. Tables, keys and GSIs are read from dynamodb-tables.yaml.
+
+Reads and writes are metered the way DynamoDB bills them: 4 KB read units
+(half for eventually consistent reads, summed per Query/Scan page), 1 KB write
+units on the larger of the old and new item, plus index writes and doubled
+units inside transactions. Every call is counted per operation.
+
+Covers the subset of the API the Lambda functions use: Get/Put/Update/Delete,
+Query and Scan (GSIs, Limit, 1 MB pages, segments, Select=COUNT), BatchGet,
+BatchWrite, TransactWriteItems, and the condition/update/projection expression
+grammar. SNS topics accept every call; other services answer with an empty
+response.
+"""
+import base64
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from decimal import Decimal
+
+import yaml
+from botocore.awsrequest import AWSResponse
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dynamodb-tables.yaml')
+
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+PAGE_BYTES = 1024 * 1024
+
+
+class StandInError(Exception):
+    def __init__(self, code, message, **extra):
+        super().__init__(message)
+        self.code = code
+        self.extra = extra
+
+
+# Attribute values stay in wire format ({'S': ...}, {'N': ...}) throughout
+
+def number(value):
+    return Decimal(value['N'])
+
+def format_number(value):
+    text = format(value.normalize(), 'f')
+    return text.rstrip('0').rstrip('.') if '.' in text else text
+
+def comparable(value):
+    # (type, python value) for ordering and equality
+    (kind, raw), = value.items()
+    if kind == 'N':
+        return kind, Decimal(raw)
+    if kind in ('SS', 'BS'):
+        return kind, frozenset(raw)
+    if kind == 'NS':
+        return kind, frozenset(Decimal(n) for n in raw)
+    if kind == 'L':
+        return kind, tuple(comparable(v) for v in raw)
+    if kind == 'M':
+        return kind, tuple(sorted((k, comparable(v)) for k, v in raw.items()))
+    return kind, raw
+
+def value_size(value):
+    (kind, raw), = value.items()
+    if kind == 'S':
+        return len(raw.encode('utf-8'))
+    if kind == 'N':
+        return len(raw.lstrip('-').replace('.', '')) // 2 + 2
+    if kind == 'B':
+        return len(base64.b64decode(raw))
+    if kind in ('BOOL', 'NULL'):
+        return 1
+    if kind == 'SS':
+        return sum(len(s.encode('utf-8')) for s in raw)
+    if kind == 'NS':
+        return sum(value_size({'N': n}) for n in raw)
+    if kind == 'BS':
+        return sum(len(base64.b64decode(b)) for b in raw)
+    if kind == 'L':
+        return 3 + sum(value_size(v) + 1 for v in raw)
+    return 3 + sum(len(k.encode('utf-8')) + value_size(v) + 1 for k, v in raw.items())
+
+def item_size(item):
+    return sum(len(name.encode('utf-8')) + value_size(value) for name, value in item.items())
+
+def units(size, unit_bytes):
+    return max(1, math.ceil(size / unit_bytes))
+
+
+# Expressions are parsed once per distinct string into tuples and evaluated against wire items
+
+TOKEN = re.compile(r'\s*(?:(<>|<=|>=|[=<>(),.\[\]+-])|([#:]?[A-Za-z0-9_]+))')
+KEYWORDS = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+CONDITION_FUNCTIONS = {'attribute_exists', 'attribute_not_exists', 'attribute_type', 'begins_with', 'contains'}
+
+
+def tokenize(text):
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if not match:
+            raise StandInError('ValidationException', f'Invalid expression: {text!r}')
+        symbol, word = match.groups()
+        if word and word.upper() in KEYWORDS:
+            symbol, word = word.upper(), None
+        tokens.append(symbol or word)
+        pos = match.end()
+    return tokens
+
+
+class Parser:
+    def __init__(self, text, names, values):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise StandInError('ValidationException', f'Invalid expression: expected {expected}, got {token}')
+        self.pos += 1
+        return token
+
+    def done(self):
+        return self.pos >= len(self.tokens)
+
+    # Operands
+    def name(self, token):
+        if token.startswith('#'):
+            if token not in self.names:
+                raise StandInError('ValidationException', f'Unresolved attribute name {token}')
+            return self.names[token]
+        return token
+
+    def path(self):
+        parts = [self.name(self.take())]
+        while self.peek() in ('.', '['):
+            if self.take() == '.':
+                parts.append(self.name(self.take()))
+            else:
+                parts.append(int(self.take()))
+                self.take(']')
+        return ('path', tuple(parts))
+
+    def operand(self):
+        token = self.peek()
+        if token.startswith(':'):
+            self.take()
+            if token not in self.values:
+                raise StandInError('ValidationException', f'Unresolved attribute value {token}')
+            return ('value', self.values[token])
+        if self.peek(1) == '(' and token in ('size', 'if_not_exists', 'list_append'):
+            self.take()
+            self.take('(')
+            args = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                args.append(self.operand())
+            self.take(')')
+            return (token,) + tuple(args)
+        return self.path()
+
+    # Conditions
+    def condition(self):
+        node = self.conjunction()
+        while self.peek() == 'OR':
+            self.take()
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.peek() == 'AND':
+            self.take()
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return ('not', self.negation())
+        return self.predicate()
+
+    def predicate(self):
+        token = self.peek()
+        if token == '(':
+            self.take()
+            node = self.condition()
+            self.take(')')
+            return node
+        if token in CONDITION_FUNCTIONS and self.peek(1) == '(':
+            self.take()
+            self.take('(')
+            args = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                args.append(self.operand())
+            self.take(')')
+            return ('function', token, tuple(args))
+
+        left = self.operand()
+        op = self.take()
+        if op == 'BETWEEN':
+            low = self.operand()
+            self.take('AND')
+            return ('between', left, low, self.operand())
+        if op == 'IN':
+            self.take('(')
+            options = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                options.append(self.operand())
+            self.take(')')
+            return ('in', left, tuple(options))
+        if op not in ('=', '<>', '<', '<=', '>', '>='):
+            raise StandInError('ValidationException', f'Invalid comparator {op}')
+        return ('compare', op, left, self.operand())
+
+    # Update expressions: {'SET': [(path, value)], 'REMOVE': [path], 'ADD': [(path, value)], 'DELETE': [...]}
+    def update(self):
+        actions = {'SET': [], 'REMOVE': [], 'ADD': [], 'DELETE': []}
+        while not self.done():
+            clause = self.take()
+            if clause not in actions:
+                raise StandInError('ValidationException', f'Invalid update clause {clause}')
+            while True:
+                target = self.path()
+                if clause == 'SET':
+                    self.take('=')
+                    value = self.operand()
+                    if self.peek() in ('+', '-'):
+                        value = (self.take(), value, self.operand())
+                    actions['SET'].append((target, value))
+                elif clause == 'REMOVE':
+                    actions['REMOVE'].append(target)
+                else:
+                    actions[clause].append((target, self.operand()))
+                if self.peek() != ',':
+                    break
+                self.take()
+        return actions
+
+    def projection(self):
+        paths = [self.path()]
+        while self.peek() == ',':
+            self.take()
+            paths.append(self.path())
+        return paths
+
+
+def parse(kind, text, names=None, values=None):
+    parser = Parser(text, names, values)
+    node = getattr(parser, kind)()
+    if not parser.done():
+        raise StandInError('ValidationException', f'Invalid expression: {text!r}')
+    return node
+
+
+def resolve(item, node):
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'path':
+        value = {'M': item}
+        for part in node[1]:
+            container = value.get('L' if isinstance(part, int) else 'M')
+            if container is None:
+                return None
+            try:
+                value = container[part]
+            except (KeyError, IndexError):
+                return None
+        return value
+    if kind == 'size':
+        value = resolve(item, node[1])
+        if value is None:
+            return None
+        (value_kind, raw), = value.items()
+        size = len(raw.encode('utf-8')) if value_kind == 'S' else len(raw)
+        return {'N': str(size)}
+    if kind == 'if_not_exists':
+        existing = resolve(item, node[1])
+        return existing if existing is not None else resolve(item, node[2])
+    if kind == 'list_append':
+        return {'L': resolve(item, node[1])['L'] + resolve(item, node[2])['L']}
+    if kind in ('+', '-'):
+        left, right = number(resolve(item, node[1])), number(resolve(item, node[2]))
+        return {'N': format_number(left + right if kind == '+' else left - right)}
+    raise StandInError('ValidationException', f'Invalid operand {kind}')
+
+
+def evaluate(item, node):
+    kind = node[0]
+    if kind == 'and':
+        return evaluate(item, node[1]) and evaluate(item, node[2])
+    if kind == 'or':
+        return evaluate(item, node[1]) or evaluate(item, node[2])
+    if kind == 'not':
+        return not evaluate(item, node[1])
+    if kind == 'function':
+        name, args = node[1], node[2]
+        value = resolve(item, args[0])
+        if name == 'attribute_exists':
+            return value is not None
+        if name == 'attribute_not_exists':
+            return value is None
+        if value is None:
+            return False
+        if name == 'attribute_type':
+            return next(iter(value)) == resolve(item, args[1])['S']
+        operand = resolve(item, args[1])
+        (value_kind, raw), = value.items()
+        if name == 'begins_with':
+            return value_kind in ('S', 'B') and raw.startswith(next(iter(operand.values())))
+        # contains: substring of a string, or member of a set or list
+        if value_kind == 'S':
+            return 'S' in operand and operand['S'] in raw
+        if value_kind in ('SS', 'NS', 'BS'):
+            return comparable(operand)[1] in comparable(value)[1]
+        if value_kind == 'L':
+            return any(comparable(v) == comparable(operand) for v in raw)
+        return False
+    if kind == 'between':
+        value, low, high = (resolve(item, n) for n in node[1:])
+        if value is None or low is None or high is None:
+            return False
+        value, low, high = comparable(value), comparable(low), comparable(high)
+        return value[0] == low[0] == high[0] and low[1] <= value[1] <= high[1]
+    if kind == 'in':
+        value = resolve(item, node[1])
+        return value is not None and any(comparable(value) == comparable(resolve(item, o)) for o in node[2])
+    if kind == 'compare':
+        op = node[1]
+        left, right = resolve(item, node[2]), resolve(item, node[3])
+        if left is None or right is None:
+            return op == '<>' and (left is None) != (right is None)
+        left, right = comparable(left), comparable(right)
+        if op == '=':
+            return left == right
+        if op == '<>':
+            return left != right
+        if left[0] != right[0]:
+            return False
+        return {'<': left[1] < right[1], '<=': left[1] <= right[1],
+                '>': left[1] > right[1], '>=': left[1] >= right[1]}[op]
+    raise StandInError('ValidationException', f'Invalid condition {kind}')
+
+
+def apply_update(item, actions):
+    # Returns the updated copy and the top-level attribute names the update touched
+    new = dict(item)
+    touched = []
+    for target, value in actions['SET']:
+        name = top_level(target)
+        new[name] = resolve(item, value)
+        touched.append(name)
+    for target in actions['REMOVE']:
+        name = top_level(target)
+        new.pop(name, None)
+        touched.append(name)
+    for target, value in actions['ADD']:
+        name = top_level(target)
+        delta = resolve(item, value)
+        current = new.get(name)
+        if 'N' in delta:
+            total = (number(current) if current else Decimal(0)) + number(delta)
+            new[name] = {'N': format_number(total)}
+        else:
+            (set_kind, members), = delta.items()
+            existing = current[set_kind] if current else []
+            new[name] = {set_kind: existing + [m for m in members if m not in existing]}
+        touched.append(name)
+    for target, value in actions['DELETE']:
+        name = top_level(target)
+        current = new.get(name)
+        if current:
+            (set_kind, members), = resolve(item, value).items()
+            remaining = [m for m in current[set_kind] if m not in members]
+            if remaining:
+                new[name] = {set_kind: remaining}
+            else:
+                del new[name]
+        touched.append(name)
+    return new, touched
+
+
+def top_level(target):
+    parts = target[1]
+    if len(parts) != 1:
+        raise StandInError('ValidationException', 'The stand-in only updates top-level attributes')
+    return parts[0]
+
+
+def project(item, paths):
+    if paths is None:
+        return dict(item)
+    return {path[1][0]: item[path[1][0]] for path in paths if path[1][0] in item}
+
+
+class Index:
+    # A GSI: partition value -> {table key: (projected item, size)}, range-sorted on demand
+    def __init__(self, name, hash_key, range_key, projection, table_keys):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.table_keys = table_keys
+        if projection['ProjectionType'] == 'ALL':
+            self.attributes = None
+        else:
+            self.attributes = set(table_keys) | {hash_key} | ({range_key} if range_key else set())
+            self.attributes |= set(projection.get('NonKeyAttributes', []))
+        self.partitions = {}
+        self.order = {}
+
+    def entry(self, item, size):
+        if self.hash_key not in item or (self.range_key and self.range_key not in item):
+            return None
+        if self.attributes is None:
+            # Stored items are never mutated in place, so ALL projections share them
+            return item, size
+        projected = {k: v for k, v in item.items() if k in self.attributes}
+        return projected, item_size(projected)
+
+    def write(self, key, old, new, old_size, new_size):
+        # Returns the number of index writes the change costs
+        old_entry = self.entry(old, old_size) if old else None
+        new_entry = self.entry(new, new_size) if new else None
+        if old_entry is None and new_entry is None:
+            return 0
+        if old_entry and new_entry and old_entry[0] == new_entry[0]:
+            return 0
+        cost = 0
+        if old_entry:
+            partition = comparable(old[self.hash_key])
+            self.partitions[partition].pop(key, None)
+            self.order.pop(partition, None)
+            if not new_entry or comparable(new[self.hash_key]) != partition:
+                cost += units(old_entry[1], WRITE_UNIT_BYTES)
+        if new_entry:
+            partition = comparable(new[self.hash_key])
+            self.partitions.setdefault(partition, {})[key] = new_entry
+            self.order.pop(partition, None)
+            cost += units(new_entry[1], WRITE_UNIT_BYTES)
+        return cost
+
+    def sorted_entries(self, partition):
+        order = self.order.get(partition)
+        if order is None:
+            entries = self.partitions.get(partition, {})
+            range_key = self.range_key
+            order = sorted(
+                entries.items(),
+                key=lambda kv: (comparable(kv[1][0][range_key]) if range_key else (), kv[0])
+            )
+            self.order[partition] = order
+        return order
+
+
+class Table:
+    def __init__(self, name, hash_key, range_key=None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.key_names = (hash_key, range_key) if range_key else (hash_key,)
+        self.items = {}
+        self.sizes = {}
+        self.indexes = {}
+        # Scan order: insertion order with tombstones, so a start key resumes in O(1)
+        self.scan_keys = []
+        self.scan_positions = {}
+        self.dead = 0
+        # Sort-key order per partition, for tables with a range key
+        self.partitions = {}
+        self.partition_order = {}
+
+    def key_of(self, item):
+        try:
+            return tuple(comparable(item[name])[1] for name in self.key_names)
+        except KeyError:
+            raise StandInError('ValidationException', f'Missing key attribute for table {self.name}')
+
+    def key_item(self, item):
+        return {name: item[name] for name in self.key_names}
+
+    def get(self, key_item):
+        return self.items.get(self.key_of(key_item))
+
+    def store(self, key, old, new):
+        # Writes (or deletes, with new=None) one item and maintains the indexes; returns write units
+        old_size = self.sizes.get(key, 0)
+        new_size = item_size(new) if new else 0
+        cost = units(max(old_size, new_size), WRITE_UNIT_BYTES)
+        if new is None:
+            if old is not None:
+                del self.items[key]
+                del self.sizes[key]
+                position = self.scan_positions.pop(key)
+                self.scan_keys[position] = None
+                self.dead += 1
+                if self.range_key:
+                    self.partitions[key[0]].discard(key)
+                    self.partition_order.pop(key[0], None)
+                if self.dead > len(self.scan_keys) // 2:
+                    self.compact()
+        else:
+            if old is None:
+                self.scan_positions[key] = len(self.scan_keys)
+                self.scan_keys.append(key)
+                if self.range_key:
+                    self.partitions.setdefault(key[0], set()).add(key)
+                    self.partition_order.pop(key[0], None)
+            self.items[key] = new
+            self.sizes[key] = new_size
+        for index in self.indexes.values():
+            cost += index.write(key, old, new, old_size, new_size)
+        return cost
+
+    def compact(self):
+        self.scan_keys = [key for key in self.scan_keys if key is not None]
+        self.scan_positions = {key: position for position, key in enumerate(self.scan_keys)}
+        self.dead = 0
+
+    def partition_keys(self, partition):
+        order = self.partition_order.get(partition)
+        if order is None:
+            order = self.partition_order[partition] = sorted(self.partitions.get(partition, ()))
+        return order
+
+
+class DynamoDBStandIn:
+    def __init__(self, template_path=TEMPLATE_PATH):
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.expressions = {}
+        self.calls = Counter()
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self.published = 0
+        self.load_template(template_path)
+
+    def load_template(self, template_path):
+        # CloudFormation short-form tags (!Ref, ...) are irrelevant here, so they load as plain values
+        class Loader(yaml.SafeLoader):
+            pass
+        Loader.add_multi_constructor('!', lambda loader, suffix, node: None)
+        with open(template_path) as f:
+            template = yaml.load(f, Loader=Loader)
+
+        for resource in template['Resources'].values():
+            if resource['Type'] != 'AWS::DynamoDB::Table':
+                continue
+            properties = resource['Properties']
+            keys = {k['KeyType']: k['AttributeName'] for k in properties['KeySchema']}
+            table = Table(properties['TableName'], keys['HASH'], keys.get('RANGE'))
+            for index in properties.get('GlobalSecondaryIndexes', []):
+                index_keys = {k['KeyType']: k['AttributeName'] for k in index['KeySchema']}
+                table.indexes[index['IndexName']] = Index(
+                    index['IndexName'], index_keys['HASH'], index_keys.get('RANGE'),
+                    index['Projection'], table.key_names
+                )
+            self.tables[table.name] = table
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls.clear()
+            self.read_units = self.write_units = 0.0
+            self.published = 0
+
+    def table(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise StandInError('ResourceNotFoundException', f'Requested resource not found: Table: {name} not found')
+
+    def expression(self, kind, text, names, values):
+        # Parsed trees are cached by their full text and placeholders
+        cache_key = (kind, text, json.dumps(names, sort_keys=True), json.dumps(values, sort_keys=True))
+        node = self.expressions.get(cache_key)
+        if node is None:
+            node = self.expressions[cache_key] = parse(kind, text, names, values)
+        return node
+
+    # Seeding: plain Python items written straight into a table, unmetered
+    def seed(self, table_name, items):
+        from boto3.dynamodb.types import TypeSerializer
+        serializer = TypeSerializer()
+        table = self.table(table_name)
+        with self.lock:
+            for item in items:
+                wire = {k: serializer.serialize(v) for k, v in item.items()}
+                key = table.key_of(wire)
+                table.store(key, table.items.get(key), wire)
+
+    def item(self, table_name, key):
+        from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+        serializer, deserializer = TypeSerializer(), TypeDeserializer()
+        with self.lock:
+            item = self.table(table_name).get({k: serializer.serialize(v) for k, v in key.items()})
+        return {k: deserializer.deserialize(v) for k, v in item.items()} if item else None
+
+    # botocore hook
+    def __call__(self, model, params, **kwargs):
+        service = model.service_model.service_name
+        operation = model.name
+        with self.lock:
+            self.calls[f'{service}.{operation}'] += 1
+        try:
+            if service == 'dynamodb':
+                request = json.loads(params['body'] or b'{}')
+                with self.lock:
+                    response = getattr(self, operation.lower())(request)
+            elif service == 'sns':
+                response = self.sns(operation, params['body'])
+            else:
+                response = {}
+        except StandInError as e:
+            parsed = {
+                'Error': {'Code': e.code, 'Message': str(e)},
+                'ResponseMetadata': {'HTTPStatusCode': 400},
+                **e.extra
+            }
+            return AWSResponse('https://standin.invalid', 400, {}, None), parsed
+        response['ResponseMetadata'] = {'HTTPStatusCode': 200}
+        return AWSResponse('https://standin.invalid', 200, {}, None), response
+
+    def sns(self, operation, body):
+        if operation == 'CreateTopic':
+            return {'TopicArn': f"arn:aws:sns:us-east-1:000000000000:{body['Name']}"}
+        if operation == 'Subscribe':
+            return {'SubscriptionArn': 'pending confirmation'}
+        if operation == 'Publish':
+            with self.lock:
+                self.published += 1
+                return {'MessageId': f'standin-{self.published}'}
+        return {}
+
+    # Metering
+    def consumed(self, request, table_name, read=0.0, write=0.0, indexes=None):
+        self.read_units += read
+        self.write_units += write
+        mode = request.get('ReturnConsumedCapacity', 'NONE')
+        if mode == 'NONE':
+            return None
+        capacity = {'TableName': table_name, 'CapacityUnits': read + write}
+        if read:
+            capacity['ReadCapacityUnits'] = read
+        if write:
+            capacity['WriteCapacityUnits'] = write
+        if mode == 'INDEXES' and indexes:
+            capacity['GlobalSecondaryIndexes'] = {name: {'CapacityUnits': cu} for name, cu in indexes.items()}
+        return capacity
+
+    @staticmethod
+    def read_cost(size, consistent):
+        return math.ceil(max(size, 1) / READ_UNIT_BYTES) * (1.0 if consistent else 0.5)
+
+    def with_capacity(self, response, capacity):
+        if capacity is not None:
+            response['ConsumedCapacity'] = capacity
+        return response
+
+    def condition_holds(self, request, item, expression_key='ConditionExpression'):
+        text = request.get(expression_key)
+        if not text:
+            return True
+        node = self.expression('condition', text, request.get('ExpressionAttributeNames'),
+                               request.get('ExpressionAttributeValues'))
+        return evaluate(item or {}, node)
+
+    def projection(self, request):
+        text = request.get('ProjectionExpression')
+        if not text:
+            return None
+        return self.expression('projection', text, request.get('ExpressionAttributeNames'), None)
+
+    # Item operations
+    def getitem(self, request):
+        table = self.table(request['TableName'])
+        item = table.get(request['Key'])
+        key = table.key_of(request['Key'])
+        read = self.read_cost(table.sizes.get(key, 0), request.get('ConsistentRead'))
+        response = {'Item': project(item, self.projection(request))} if item else {}
+        return self.with_capacity(response, self.consumed(request, table.name, read=read))
+
+    def write_item(self, request, table, key, old, new):
+        write = table.store(key, old, new)
+        return self.consumed(request, table.name, write=write)
+
+    def check_condition(self, request, item):
+        if not self.condition_holds(request, item):
+            extra = {'Item': item} if item and request.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD' else {}
+            raise StandInError('ConditionalCheckFailedException', 'The conditional request failed', **extra)
+
+    def putitem(self, request):
+        table = self.table(request['TableName'])
+        new = request['Item']
+        key = table.key_of(new)
+        old = table.items.get(key)
+        try:
+            self.check_condition(request, old)
+        except StandInError:
+            self.consumed(request, table.name, write=1.0)
+            raise
+        capacity = self.write_item(request, table, key, old, dict(new))
+        response = {'Attributes': dict(old)} if old and request.get('ReturnValues') == 'ALL_OLD' else {}
+        return self.with_capacity(response, capacity)
+
+    def updateitem(self, request):
+        table = self.table(request['TableName'])
+        key = table.key_of(request['Key'])
+        old = table.items.get(key)
+        try:
+            self.check_condition(request, old)
+        except StandInError:
+            self.consumed(request, table.name, write=1.0)
+            raise
+        actions = self.expression('update', request['UpdateExpression'], request.get('ExpressionAttributeNames'),
+                                  request.get('ExpressionAttributeValues'))
+        new, touched = apply_update(old or dict(request['Key']), actions)
+        capacity = self.write_item(request, table, key, old, new)
+
+        returns = request.get('ReturnValues', 'NONE')
+        source = {'ALL_NEW': new, 'UPDATED_NEW': new, 'ALL_OLD': old, 'UPDATED_OLD': old}.get(returns) or {}
+        if returns.startswith('UPDATED'):
+            source = {name: source[name] for name in touched if name in source}
+        response = {'Attributes': dict(source)} if source else {}
+        return self.with_capacity(response, capacity)
+
+    def deleteitem(self, request):
+        table = self.table(request['TableName'])
+        key = table.key_of(request['Key'])
+        old = table.items.get(key)
+        try:
+            self.check_condition(request, old)
+        except StandInError:
+            self.consumed(request, table.name, write=1.0)
+            raise
+        capacity = self.write_item(request, table, key, old, None) if old else self.consumed(request, table.name, write=1.0)
+        response = {'Attributes': dict(old)} if old and request.get('ReturnValues') == 'ALL_OLD' else {}
+        return self.with_capacity(response, capacity)
+
+    # Query and Scan
+    def page(self, request, table, entries, start_key):
+        # entries: iterable of (table key, item, size) in read order, already positioned after start_key
+        limit = request.get('Limit')
+        filter_text = request.get('FilterExpression')
+        projection = self.projection(request)
+        count_only = request.get('Select') == 'COUNT'
+        index = table.indexes.get(request.get('IndexName')) if request.get('IndexName') else None
+
+        items, count, scanned, read_bytes = [], 0, 0, 0
+        last = None
+        more = False
+        for key, item, size in entries:
+            if (limit and scanned >= limit) or read_bytes >= PAGE_BYTES:
+                more = True
+                break
+            scanned += 1
+            read_bytes += size
+            last = item
+            if filter_text and not self.condition_holds(request, item, 'FilterExpression'):
+                continue
+            count += 1
+            if not count_only:
+                items.append(project(item, projection))
+
+        response = {'Count': count, 'ScannedCount': scanned}
+        if not count_only:
+            response['Items'] = items
+        if more and last is not None:
+            last_key = table.key_item(last)
+            if index:
+                last_key[index.hash_key] = last[index.hash_key]
+                if index.range_key:
+                    last_key[index.range_key] = last[index.range_key]
+            response['LastEvaluatedKey'] = last_key
+        read = self.read_cost(read_bytes, request.get('ConsistentRead'))
+        return self.with_capacity(response, self.consumed(request, table.name, read=read))
+
+    def query(self, request):
+        table = self.table(request['TableName'])
+        index = table.indexes.get(request['IndexName']) if request.get('IndexName') else None
+        hash_key = index.hash_key if index else table.hash_key
+        range_key = index.range_key if index else table.range_key
+        node = self.expression('condition', request['KeyConditionExpression'],
+                               request.get('ExpressionAttributeNames'), request.get('ExpressionAttributeValues'))
+        partition = partition_value(node, hash_key)
+        if partition is None:
+            raise StandInError('ValidationException', f'Query condition must fix the partition key {hash_key}')
+
+        if index:
+            ordered = ((key, entry[0], entry[1]) for key, entry in index.sorted_entries(partition))
+        elif range_key:
+            ordered = ((key, table.items[key], table.sizes[key]) for key in table.partition_keys(partition[1]))
+        else:
+            key = (partition[1],)
+            ordered = [(key, table.items[key], table.sizes[key])] if key in table.items else []
+
+        ordered = [entry for entry in ordered if evaluate(entry[1], node)]
+        if request.get('ScanIndexForward') is False:
+            ordered.reverse()
+        start = request.get('ExclusiveStartKey')
+        if start:
+            start_key = table.key_of(start)
+            positions = [key for key, _, _ in ordered]
+            ordered = ordered[positions.index(start_key) + 1:] if start_key in positions else []
+        return self.page(request, table, ordered, start)
+
+    def scan(self, request):
+        table = self.table(request['TableName'])
+        if request.get('IndexName'):
+            raise StandInError('ValidationException', 'The stand-in does not scan indexes')
+        position = 0
+        start = request.get('ExclusiveStartKey')
+        if start:
+            position = table.scan_positions.get(table.key_of(start), -1) + 1
+        segment, total = request.get('Segment'), request.get('TotalSegments')
+        keys = table.scan_keys
+
+        def entries():
+            for i in range(position, len(keys)):
+                key = keys[i]
+                if key is None or (total and hash(key) % total != segment):
+                    continue
+                yield key, table.items[key], table.sizes[key]
+        return self.page(request, table, entries(), start)
+
+    # Batch and transaction operations
+    def batchgetitem(self, request):
+        responses, capacity = {}, []
+        for table_name, spec in request['RequestItems'].items():
+            table = self.table(table_name)
+            projection = self.projection(spec)
+            found, read = [], 0.0
+            for key_item in spec['Keys']:
+                key = table.key_of(key_item)
+                item = table.items.get(key)
+                read += self.read_cost(table.sizes.get(key, 0), spec.get('ConsistentRead'))
+                if item:
+                    found.append(project(item, projection))
+            responses[table_name] = found
+            capacity.append(self.consumed(request, table_name, read=read))
+        response = {'Responses': responses, 'UnprocessedKeys': {}}
+        return self.with_capacity(response, capacity if capacity[0] is not None else None)
+
+    def batchwriteitem(self, request):
+        capacity = []
+        for table_name, writes in request['RequestItems'].items():
+            table = self.table(table_name)
+            write = 0.0
+            for entry in writes:
+                if 'PutRequest' in entry:
+                    new = dict(entry['PutRequest']['Item'])
+                    key = table.key_of(new)
+                else:
+                    new = None
+                    key = table.key_of(entry['DeleteRequest']['Key'])
+                old = table.items.get(key)
+                write += table.store(key, old, new) if old or new else 1.0
+            capacity.append(self.consumed(request, table_name, write=write))
+        response = {'UnprocessedItems': {}}
+        return self.with_capacity(response, capacity if capacity[0] is not None else None)
+
+    def transactwriteitems(self, request):
+        # All conditions are checked against the current state before anything is written
+        operations = []
+        reasons = []
+        for entry in request['TransactItems']:
+            (kind, spec), = entry.items()
+            table = self.table(spec['TableName'])
+            key = table.key_of(spec['Item'] if kind == 'Put' else spec['Key'])
+            old = table.items.get(key)
+            holds = self.condition_holds(spec, old)
+            reasons.append({'Code': 'None'} if holds else {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'})
+            operations.append((kind, spec, table, key, old))
+
+        if any(reason['Code'] != 'None' for reason in reasons):
+            self.consumed(request, operations[0][2].name, write=2.0 * len(operations))
+            codes = ', '.join(reason['Code'] for reason in reasons)
+            raise StandInError(
+                'TransactionCanceledException',
+                f'Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]',
+                CancellationReasons=reasons
+            )
+
+        capacity = {}
+        for kind, spec, table, key, old in operations:
+            if kind == 'ConditionCheck':
+                write = 1.0
+            elif kind == 'Put':
+                write = table.store(key, old, dict(spec['Item']))
+            elif kind == 'Delete':
+                write = table.store(key, old, None) if old else 1.0
+            else:
+                actions = self.expression('update', spec['UpdateExpression'], spec.get('ExpressionAttributeNames'),
+                                          spec.get('ExpressionAttributeValues'))
+                new, _ = apply_update(old or dict(spec['Key']), actions)
+                write = table.store(key, old, new)
+            capacity[table.name] = capacity.get(table.name, 0.0) + 2 * write
+
+        consumed = [self.consumed(request, name, write=write) for name, write in capacity.items()]
+        return self.with_capacity({}, consumed if consumed[0] is not None else None)
+
+    def describetable(self, request):
+        table = self.table(request['TableName'])
+        return {'Table': {'TableName': table.name, 'TableStatus': 'ACTIVE', 'ItemCount': len(table.items)}}
+
+
+def partition_value(node, hash_key):
+    # The key condition's `hash_key = :value` term, as a comparable partition value (or None)
+    if node[0] == 'and':
+        return partition_value(node[1], hash_key) or partition_value(node[2], hash_key)
+    if node[0] == 'compare' and node[1] == '=':
+        left, right = node[2], node[3]
+        if left[0] == 'value':
+            left, right = right, left
+        if left == ('path', (hash_key,)) and right[0] == 'value':
+            return comparable(right[1])
+    return None
+
+
+def install(standin, boto_session):
+    # Routes every call made through the session's clients and resources to the stand-in
+    boto_session.events.register('before-call', standin)
+    return standin
+
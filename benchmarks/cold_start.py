@@ -0,0 +1,124 @@
+"""Cold-start and warm-path benchmark for the Lambda handlers.
+
+Each run starts a fresh interpreter per handler (a stand-in for a new Lambda
+container), times the module import, the first invocation (which creates the
+shared AWS clients) and a series of warm invocations. AWS calls never leave
+the process: a botocore before-call hook answers them with canned responses,
+so the numbers measure our own init and per-invocation overhead.
+
+    python benchmarks/cold_start.py [--runs 5] [--warm 200]
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions')
+
+HEADERS = {'x-user-id': 'bench-user', 'x-username': 'bench', 'x-role': 'admin'}
+
+# handler module -> event used for the first and warm invocations
+EVENTS = {
+    'dashboard': {'httpMethod': 'GET', 'path': '/dashboard', 'headers': HEADERS, 'queryStringParameters': {'limit': '50'}},
+    'license_manager': {
+        'httpMethod': 'PUT', 'path': '/licenses/bench-license', 'headers': HEADERS,
+        'pathParameters': {'id': 'bench-license'}, 'body': json.dumps({'new_expiry': '2031-01-01'})
+    },
+    'admin': {
+        'httpMethod': 'DELETE', 'path': '/admin/licenses/bench-license', 'headers': HEADERS,
+        'pathParameters': {'id': 'bench-license'}
+    },
+    'auth_handler': {
+        'httpMethod': 'POST', 'path': '/auth', 'headers': {},
+        'body': json.dumps({'action': 'login', 'username': 'bench', 'password': 'password1'})
+    },
+    'license_tracker': {}
+}
+
+ITEM = {
+    'user_id': {'S': 'bench-user'}, 'username': {'S': 'bench'}, 'password': {'S': 'password1'},
+    'role': {'S': 'admin'}, 'license_id': {'S': 'bench-license'}, 'name': {'S': 'Bench'},
+    'expiry_date': {'S': '2030-01-01'}, 'primary_email': {'S': 'bench@example.com'}
+}
+
+CANNED = {
+    'GetItem': {'Item': ITEM},
+    'Query': {'Items': [ITEM], 'Count': 1},
+    'Scan': {'Items': [ITEM], 'Count': 1},
+    'UpdateItem': {'Attributes': {'total_users': {'N': '2'}}},
+    'BatchGetItem': {'Responses': {}},
+    'BatchWriteItem': {'UnprocessedItems': {}},
+    'Publish': {'MessageId': 'bench'}
+}
+
+def canned_response(model, **kwargs):
+    # boto3 deserialises responses in place, so every call gets a fresh copy
+    from botocore.awsrequest import AWSResponse
+    return AWSResponse('https://bench.invalid', 200, {}, None), copy.deepcopy(CANNED.get(model.name, {}))
+
+def child(module_name, warm):
+    # Runs inside the fresh interpreter; handler output is discarded by the caller
+    os.environ.pop('TEAMS_WEBHOOK', None)
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    sys.path.insert(0, FUNCTIONS_DIR)
+
+    start = time.perf_counter()
+    module = __import__(module_name)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import aws_runtime
+    aws_runtime.session().events.register('before-call', canned_response)
+
+    event = EVENTS[module_name]
+    start = time.perf_counter()
+    module.lambda_handler(event, None)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for _ in range(warm):
+        start = time.perf_counter()
+        module.lambda_handler(event, None)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return {'import_ms': import_ms, 'first_ms': first_ms, 'warm_ms': statistics.median(samples)}
+
+def run(module_name, warm):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', module_name, '--warm', str(warm)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per handler')
+    parser.add_argument('--warm', type=int, default=200, help='warm invocations per interpreter')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                result = child(args.child, args.warm)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    print(f"{'handler':<18}{'import ms':>11}{'first call ms':>15}{'init total ms':>15}{'warm call ms':>14}")
+    for module_name in EVENTS:
+        results = [run(module_name, args.warm) for _ in range(args.runs)]
+        import_ms = statistics.median(r['import_ms'] for r in results)
+        first_ms = statistics.median(r['first_ms'] for r in results)
+        warm_ms = statistics.median(r['warm_ms'] for r in results)
+        print(f"{module_name:<18}{import_ms:>11.1f}{first_ms:>15.1f}{import_ms + first_ms:>15.1f}{warm_ms:>14.3f}")
+
+if __name__ == '__main__':
+    main()
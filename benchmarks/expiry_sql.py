@@ -0,0 +1,85 @@
+"""Expiry computation benchmark for the Flask app.
+
+Seeds a throwaway SQLite database with synthetic licenses and compares the
+old approach (fetch every row, parse each expiry date in Python) with the SQL
+helpers the app now uses, for both the reminder selection and the dashboard's
+"expiring soon" count.
+
+    python benchmarks/expiry_sql.py [--rows 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+def seed(conn, rows, today):
+    random.seed(42)
+    licenses = (
+        (f"License {i}", (today + timedelta(days=random.randint(-365, 730))).isoformat(),
+         f"owner{i}@example.com", f"Owner {i % 500}")
+        for i in range(rows)
+    )
+    conn.executemany("INSERT INTO licenses (name, expiry_date, email, owner_name) VALUES (?, ?, ?, ?)", licenses)
+    conn.commit()
+
+def python_due(conn, today):
+    due = []
+    for name, expiry, email, owner in conn.execute("SELECT name, expiry_date, email, owner_name FROM licenses"):
+        days_left = (datetime.strptime(expiry, "%Y-%m-%d").date() - today).days
+        if days_left in [45, 30, 15, 7, 1]:
+            due.append((name, expiry, email, owner, days_left))
+    return due
+
+def python_count(conn, today):
+    return sum(
+        1 for (expiry,) in conn.execute("SELECT expiry_date FROM licenses")
+        if expiry and (datetime.strptime(expiry, "%Y-%m-%d").date() - today).days <= 30
+    )
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='synthetic licenses to seed')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per variant')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app opens its database at import time, so point it at the scratch file first
+        os.environ['DATABASE_PATH'] = os.path.join(tmp, 'bench.db')
+        sys.path.insert(0, APP_DIR)
+        import app
+        app.scheduler.shutdown(wait=False)
+
+        today = date.today()
+        with app.pool.connection() as conn:
+            seed(conn, args.rows, today)
+            c = conn.cursor()
+            cases = [
+                ('reminders', lambda: sorted(python_due(conn, today)), lambda: sorted(app.due_licenses(c, today))),
+                ('expiring soon', lambda: python_count(conn, today), lambda: app.count_expiring_soon(c, today))
+            ]
+
+            print(f"{args.rows} licenses, median of {args.repeat} runs")
+            print(f"{'query':<16}{'python ms':>12}{'sql ms':>10}{'speedup':>10}")
+            for label, old, new in cases:
+                old_result, old_ms = timed(old, args.repeat)
+                new_result, new_ms = timed(new, args.repeat)
+                assert old_result == new_result, f"{label}: results differ"
+                print(f"{label:<16}{old_ms:>12.1f}{new_ms:>10.1f}{old_ms / new_ms:>9.1f}x")
+        app.pool.close_all()
+
+if __name__ == '__main__':
+    main()
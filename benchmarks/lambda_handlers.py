@@ -0,0 +1,368 @@
+"""Data-scaling benchmark for the Lambda handlers.
+
+Seeds the in-memory DynamoDB/SNS stand-in (benchmarks/aws_standin.py) with
+N licenses and N users, then drives the dashboard, license manager, admin,
+auth and tracker handlers with API Gateway proxy events. Each dataset size runs
+in a fresh interpreter, so warm-container caches start cold as in a new Lambda
+container. Teams cards go to a local HTTP sink.
+
+For every scenario it reports p50/p99 latency, AWS calls per invocation and
+the read/write units DynamoDB would bill. Latency includes the stand-in's own
+work in place of network round trips, so compare it between runs rather than
+with production numbers; call counts and units are deterministic.
+
+    python benchmarks/lambda_handlers.py [--sizes 1000 10000 100000] [--iterations 50]
+    python benchmarks/lambda_handlers.py --save-baseline    # record benchmarks/baseline.json
+    python benchmarks/lambda_handlers.py --compare          # flag regressions against it
+
+Notification rate limits are lifted (the stand-in has no quotas). Worker,
+segmented-scan and search-index modes are not driven.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(BENCH_DIR, '..', 'functions')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# Relative growth reported as a regression. Counts and units are deterministic for a given
+# date, but the seed is relative to today, so month buckets shift slightly between runs.
+LATENCY_TOLERANCE = 0.25
+COUNT_TOLERANCE = 0.05
+
+OWNERS = 500
+PRODUCTS = ('Acme CAD', 'Globex Office', 'Initech Backup', 'Umbrella VPN', 'Hooli Cloud', 'Vandelay Analytics',
+            'Stark Design', 'Wayne Security', 'Wonka Mail', 'Tyrell Render')
+
+ADMIN = {'user_id': 'bench-admin', 'username': 'bench_admin', 'password': 'password1', 'role': 'admin'}
+
+
+class TeamsSinkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.posts += 1
+        self.send_response(200)
+        self.send_header('Content-Length', '1')
+        self.end_headers()
+        self.wfile.write(b'1')
+
+    def log_message(self, *args):
+        pass
+
+
+class TeamsSink(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), TeamsSinkHandler)
+        self.lock = threading.Lock()
+        self.posts = 0
+
+
+def api_event(method, path, resource=None, headers=None, query=None, path_params=None, body=None):
+    # API Gateway REST proxy event, as the frontend's requests arrive
+    return {
+        'resource': resource or path,
+        'path': path,
+        'httpMethod': method,
+        'headers': {'Accept': 'application/json', 'Content-Type': 'application/json', **(headers or {})},
+        'queryStringParameters': query,
+        'pathParameters': path_params,
+        'requestContext': {
+            'resourcePath': resource or path,
+            'httpMethod': method,
+            'stage': 'prod',
+            'requestId': str(uuid.uuid4()),
+            'identity': {'sourceIp': '203.0.113.10'}
+        },
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def identity(user):
+    return {'x-user-id': user['user_id'], 'x-username': user['username'], 'x-role': user['role']}
+
+
+def license_record(i, today, rng):
+    owner = rng.randrange(OWNERS)
+    second = rng.randrange(OWNERS)
+    # Mostly future expiries, with a tail of lapsed licenses nobody renewed
+    days = rng.randint(-365, -1) if rng.random() < 0.03 else rng.randint(0, 1095)
+    expiry = (today + timedelta(days=days)).isoformat()
+    return {
+        'license_id': f'lic-{i:07d}',
+        'name': f'{PRODUCTS[i % len(PRODUCTS)]} {i}',
+        'expiry_date': expiry,
+        'expiry_month': expiry[:7],
+        'primary_email': f'owner{owner}@example.com',
+        'primary_owner': f'Owner {owner}',
+        'secondary_email': f'owner{second}@example.com',
+        'secondary_owner': f'Owner {second}',
+        'created_by': ADMIN['user_id'],
+        'created_by_username': ADMIN['username'],
+        'created_at': f'{today.isoformat()}T09:00:00',
+        'change_day': '2000-01-01',
+        'changed_at': '2000-01-01T00:00:00'
+    }
+
+
+def seed(standin, size, today):
+    import stats
+
+    rng = random.Random(42)
+    licenses = [license_record(i, today, rng) for i in range(size)]
+    users = [ADMIN] + [
+        {'user_id': f'user-{i:07d}', 'username': f'user_{i}', 'password': 'password1', 'role': 'general'}
+        for i in range(1, size)
+    ]
+    standin.seed('licenses', licenses)
+    standin.seed('users', users)
+    standin.seed('usernames', ({'username': u['username'], 'user_id': u['user_id']} for u in users))
+    standin.seed(stats.STATS_TABLE, [{
+        **stats.STATS_KEY,
+        'total_users': len(users),
+        'admin_count': 1,
+        'total_licenses': len(licenses),
+        'expiring_soon': sum(stats.is_expiring_soon(lic['expiry_date'], today) for lic in licenses),
+        'expiring_soon_as_of': today.isoformat()
+    }])
+    return licenses, users
+
+
+def scenarios(size, licenses, users, iterations, standin):
+    # (name, handler module, iterations, event factory, untimed setup or None)
+    import dashboard
+    import stats
+
+    admin_headers = identity(ADMIN)
+    general_headers = identity(users[1])
+    rng = random.Random(7)
+    renew_to = (date.today() + timedelta(days=400)).isoformat()
+    targets = iter(users[1:])
+    doomed_licenses = iter(licenses[::-1])
+    new_license = {
+        'license_name': 'Bench Suite', 'expiry_date': renew_to,
+        'primary_owner_email': 'owner1@example.com', 'primary_owner_name': 'Owner 1',
+        'secondary_owner_email': 'owner2@example.com', 'secondary_owner_name': 'Owner 2'
+    }
+    import_rows = '\n'.join(json.dumps({**new_license, 'license_name': f'Imported {n}'}) for n in range(100))
+    promoted = {}
+
+    def reset_promotion():
+        # Back to one admin and a general target, so every iteration takes the success path
+        user = next(targets)
+        promoted['user'] = user
+        standin.seed(stats.STATS_TABLE, [{**standin.item(stats.STATS_TABLE, stats.STATS_KEY), 'admin_count': 1}])
+
+    def cold_snapshot():
+        dashboard.snapshot.clear()
+
+    def dashboard_event(headers, **query):
+        return api_event('GET', '/dashboard', headers=headers, query=query or None)
+
+    def revalidate_event():
+        # The frontend's repeat request, carrying the ETag of the unchanged first page
+        version = int(standin.item(stats.STATS_TABLE, stats.STATS_KEY).get(stats.VERSION, 0))
+        etag = dashboard.dashboard_etag(version, admin_headers, {'limit': '50'}, date.today())
+        return dashboard_event({**admin_headers, 'If-None-Match': etag}, limit='50')
+
+    # EventBridge schedule: the first run notifies every due license, reruns find them in the ledger.
+    # Runs before the write scenarios, which renew and delete some of the seeded licenses.
+    yield 'tracker.first_run', 'license_tracker', 1, lambda: {'source': 'aws.events', 'detail-type': 'Scheduled Event'}, None
+    yield 'tracker.rerun', 'license_tracker', min(iterations, 3), lambda: {'source': 'aws.events', 'detail-type': 'Scheduled Event'}, None
+
+    yield 'dashboard.first_page_admin', 'dashboard', iterations, lambda: dashboard_event(admin_headers, limit='50'), None
+    yield 'dashboard.first_page_gzip', 'dashboard', iterations, lambda: dashboard_event(
+        {**admin_headers, 'Accept': dashboard.GZIP_MEDIA_TYPE, 'Accept-Encoding': 'gzip, deflate, br'}, limit='50'
+    ), None
+    yield 'dashboard.revalidate', 'dashboard', iterations, revalidate_event, None
+    yield 'dashboard.first_page', 'dashboard', iterations, lambda: dashboard_event(general_headers, limit='50'), None
+    yield 'dashboard.next_page', 'dashboard', iterations, lambda: dashboard_event(
+        general_headers, limit='50',
+        cursor=dashboard.encode_cursor({'license_id': licenses[rng.randrange(size)]['license_id']})
+    ), None
+    yield 'dashboard.search_cold', 'dashboard', min(iterations, 5), lambda: dashboard_event(general_headers, query='globex'), cold_snapshot
+    yield 'dashboard.search', 'dashboard', iterations, lambda: dashboard_event(general_headers, query=rng.choice(('acme', 'owner 4', 'vpn 1'))), None
+
+    yield 'auth.login', 'auth_handler', iterations, lambda: api_event(
+        'POST', '/auth', body=json.dumps({'action': 'login', 'username': users[rng.randrange(size)]['username'], 'password': 'password1'})
+    ), None
+    yield 'auth.signup', 'auth_handler', iterations, lambda: api_event(
+        'POST', '/auth', body=json.dumps({'action': 'signup', 'username': f'new_{uuid.uuid4().hex[:12]}', 'password': 'password1'})
+    ), None
+
+    yield 'licenses.add', 'license_manager', iterations, lambda: api_event(
+        'POST', '/licenses', headers=admin_headers, body=json.dumps(new_license)
+    ), None
+    yield 'licenses.update', 'license_manager', iterations, lambda: (lambda lic: api_event(
+        'PUT', f"/licenses/{lic['license_id']}", resource='/licenses/{license_id}',
+        headers=admin_headers, path_params={'id': lic['license_id']}, body=json.dumps({'new_expiry': renew_to})
+    ))(rng.choice(licenses)), None
+    yield 'licenses.batch_renew_100', 'license_manager', iterations, lambda: api_event(
+        'PUT', '/licenses', headers=admin_headers,
+        body=json.dumps({'licenses': [{'id': lic['license_id'], 'new_expiry': renew_to} for lic in rng.sample(licenses, 100)]})
+    ), None
+    yield 'licenses.bulk_import_100', 'license_manager', iterations, lambda: api_event(
+        'POST', '/licenses/bulk', headers={**admin_headers, 'Content-Type': 'application/x-ndjson'}, body=import_rows
+    ), None
+    yield 'licenses.export_page', 'license_manager', min(iterations, 10), lambda: api_event(
+        'GET', '/licenses/export', headers=admin_headers, query={'format': 'ndjson'}
+    ), None
+
+    yield 'admin.promote', 'admin', iterations, lambda: api_event(
+        'POST', f"/admin/users/{promoted['user']['user_id']}/promote", resource='/admin/users/{user_id}/promote',
+        headers=admin_headers, path_params={'id': promoted['user']['user_id']}
+    ), reset_promotion
+    yield 'admin.delete_user', 'admin', iterations, lambda: (lambda user: api_event(
+        'DELETE', f"/admin/users/{user['user_id']}", resource='/admin/users/{user_id}',
+        headers=admin_headers, path_params={'id': user['user_id']}
+    ))(next(targets)), None
+    yield 'admin.delete_license', 'admin', iterations, lambda: (lambda lic: api_event(
+        'DELETE', f"/admin/licenses/{lic['license_id']}", resource='/admin/licenses/{license_id}',
+        headers=admin_headers, path_params={'id': lic['license_id']}
+    ))(next(doomed_licenses)), None
+
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def child(size, iterations):
+    # Runs inside the fresh interpreter; handler output is discarded by the caller
+    sink = TeamsSink()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    os.environ.update({
+        'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_ACCESS_KEY_ID': 'bench', 'AWS_SECRET_ACCESS_KEY': 'bench',
+        'TEAMS_WEBHOOK': f'http://127.0.0.1:{sink.server_address[1]}/webhook',
+        'SNS_RATE_PER_SEC': '1000000', 'TEAMS_RATE_PER_SEC': '1000000'
+    })
+    sys.path.insert(0, FUNCTIONS_DIR)
+
+    import aws_runtime
+    from aws_standin import DynamoDBStandIn, install
+    standin = install(DynamoDBStandIn(), aws_runtime.session())
+
+    today = datetime.today().date()
+    licenses, users = seed(standin, size, today)
+
+    results = {}
+    for name, module_name, runs, make_event, setup in scenarios(size, licenses, users, iterations, standin):
+        handler = __import__(module_name).lambda_handler
+        samples, statuses = [], set()
+        standin.reset_counters()
+        posts = sink.posts
+        for _ in range(runs):
+            if setup:
+                setup()
+            event = make_event()
+            start = time.perf_counter()
+            response = handler(event, None)
+            samples.append((time.perf_counter() - start) * 1000)
+            statuses.add(response.get('statusCode'))
+
+        calls = dict(standin.calls)
+        calls_total = sum(calls.values()) + sink.posts - posts
+        results[name] = {
+            'runs': runs,
+            'status': sorted(statuses),
+            'p50_ms': round(statistics.median(samples), 3),
+            'p99_ms': round(percentile(samples, 99), 3),
+            'calls': round(calls_total / runs, 2),
+            'rcu': round(standin.read_units / runs, 2),
+            'wcu': round(standin.write_units / runs, 2),
+            'calls_by_operation': {op: round(n / runs, 2) for op, n in sorted(calls.items())},
+            'teams_posts': round((sink.posts - posts) / runs, 2)
+        }
+    sink.shutdown()
+    return results
+
+
+def run(size, iterations):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', str(size), '--iterations', str(iterations)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def regressions(size, results, baseline):
+    found = []
+    for name, result in results.items():
+        before = baseline.get(str(size), {}).get(name)
+        if not before:
+            continue
+        for metric in ('calls', 'rcu', 'wcu'):
+            if result[metric] > before[metric] * (1 + COUNT_TOLERANCE) + 1e-9:
+                found.append(f"{size} {name}: {metric} {before[metric]} -> {result[metric]}")
+        if result['p50_ms'] > before['p50_ms'] * (1 + LATENCY_TOLERANCE):
+            found.append(f"{size} {name}: p50 {before['p50_ms']:.2f} ms -> {result['p50_ms']:.2f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='licenses (and users) to seed')
+    parser.add_argument('--iterations', type=int, default=50, help='invocations per scenario')
+    parser.add_argument('--save-baseline', action='store_true', help=f'write the results to {os.path.relpath(BASELINE_PATH)}')
+    parser.add_argument('--compare', action='store_true', help='exit non-zero when a scenario regressed against the baseline')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results = child(args.child, args.iterations)
+        print(json.dumps(results))
+        return
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    all_results, found = {}, []
+    for size in args.sizes:
+        results = all_results[str(size)] = run(size, args.iterations)
+        print(f"\n{size} licenses / {size} users")
+        print(f"{'scenario':<28}{'status':>10}{'p50 ms':>10}{'p99 ms':>10}{'calls':>9}{'RCU':>10}{'WCU':>10}")
+        for name, r in results.items():
+            status = '/'.join(str(s) for s in r['status'])
+            print(f"{name:<28}{status:>10}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['calls']:>9.1f}{r['rcu']:>10.1f}{r['wcu']:>10.1f}")
+        found += regressions(size, results, baseline)
+
+    if args.save_baseline:
+        baseline.update(all_results)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline written to {os.path.relpath(BASELINE_PATH)}")
+
+    if baseline and found:
+        print("\nRegressions against the baseline:")
+        for line in found:
+            print(f"  {line}")
+        if args.compare:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Cold-start comparison: four API functions versus the single router function.
+
+First measures, in fresh interpreters, what a cold container costs for each
+handler module and for functions/router.py (import plus first invocation, with
+AWS calls answered by cold_start.py's canned responses), and what the router
+pays to load another handler module once it is already warm. Then replays the
+same bursty trace of user sessions against both deployments, modelled as
+per-function container pools that stay warm for --idle-minutes after their last
+request, and reports how many requests landed on a cold container.
+
+    python benchmarks/router_cold_start.py [--hours 72] [--session-gap-minutes 12] [--idle-minutes 7]
+
+--platform-init-ms stands in for the sandbox and runtime start-up that a local
+interpreter can't measure; it is charged to every cold start in both setups.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from cold_start import EVENTS, FUNCTIONS_DIR, canned_response
+
+HANDLERS = ('auth_handler', 'dashboard', 'license_manager', 'admin')
+
+# What a session does after logging in: (handler module, weight)
+ACTIONS = (('dashboard', 50), ('license_manager', 30), ('admin', 8), ('auth_handler', 2))
+
+
+def child(mode, module_name, warm):
+    # Runs inside the fresh interpreter; handler output is discarded by the caller
+    os.environ.pop('TEAMS_WEBHOOK', None)
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    sys.path.insert(0, FUNCTIONS_DIR)
+
+    start = time.perf_counter()
+    entry = __import__('router' if mode != 'direct' else module_name)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    import aws_runtime
+    aws_runtime.session().events.register('before-call', canned_response)
+
+    if mode == 'router-add':
+        # Warm the container on another module first, then time loading this one
+        other = 'dashboard' if module_name != 'dashboard' else 'auth_handler'
+        entry.lambda_handler(dict(EVENTS[other]), None)
+
+    event = EVENTS[module_name]
+    start = time.perf_counter()
+    entry.lambda_handler(dict(event), None)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for _ in range(warm):
+        start = time.perf_counter()
+        entry.lambda_handler(dict(event), None)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    init_ms = first_ms if mode == 'router-add' else import_ms + first_ms
+    return {'init_ms': init_ms, 'warm_ms': statistics.median(samples)}
+
+
+def measure(mode, module_name, runs, warm):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', mode, module_name, '--warm', str(warm)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(r[key] for r in results) for key in ('init_ms', 'warm_ms')}
+
+
+def trace(hours, session_gap_minutes, session_length, think_seconds, seed):
+    # (arrival seconds, handler module): sessions arrive in a Poisson process, each a login
+    # followed by a geometric number of actions separated by exponential think times
+    rng = random.Random(seed)
+    modules, weights = zip(*ACTIONS)
+    requests = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(1 / (session_gap_minutes * 60))
+        if t > hours * 3600:
+            break
+        at = t
+        requests.append((at, 'auth_handler'))
+        while rng.random() > 1 / session_length:
+            at += rng.expovariate(1 / think_seconds)
+            requests.append((at, rng.choices(modules, weights)[0]))
+    return sorted(requests)
+
+
+def simulate(requests, function_of, costs, idle_seconds, platform_init_ms):
+    # Each function keeps its own pool of containers: [busy until, warm until, loaded modules]
+    pools = {}
+    cold = 0
+    latencies = []
+    for at, module_name in requests:
+        pool = pools.setdefault(function_of(module_name), [])
+        container = next((c for c in pool if c[0] <= at <= c[1]), None)
+        if container is None:
+            cold += 1
+            latency = platform_init_ms + costs['cold'][module_name]
+            container = [0.0, 0.0, {module_name}]
+            pool.append(container)
+        elif module_name not in container[2]:
+            # Router only: a warm container meeting this handler module for the first time
+            latency = costs['add'][module_name]
+            container[2].add(module_name)
+        else:
+            latency = costs['warm'][module_name]
+        latencies.append(latency)
+        container[0] = at + latency / 1000
+        container[1] = container[0] + idle_seconds
+        pool[:] = [c for c in pool if c[1] >= at]
+    return {
+        'cold': cold,
+        'mean_ms': statistics.mean(latencies),
+        'p99_ms': statistics.quantiles(latencies, n=100)[98]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per measurement')
+    parser.add_argument('--warm', type=int, default=50, help='warm invocations per interpreter')
+    parser.add_argument('--hours', type=float, default=72, help='length of the simulated trace')
+    parser.add_argument('--session-gap-minutes', type=float, default=12, help='mean time between user sessions')
+    parser.add_argument('--session-length', type=float, default=6, help='mean requests per session after login')
+    parser.add_argument('--think-seconds', type=float, default=20, help='mean time between requests in a session')
+    parser.add_argument('--idle-minutes', type=float, default=7, help='how long an idle container stays warm')
+    parser.add_argument('--platform-init-ms', type=float, default=250, help='sandbox and runtime start-up per cold start')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                result = child(args.child[0], args.child[1], args.warm)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    direct = {m: measure('direct', m, args.runs, args.warm) for m in HANDLERS}
+    routed = {m: measure('router', m, args.runs, args.warm) for m in HANDLERS}
+    added = {m: measure('router-add', m, args.runs, args.warm) for m in HANDLERS}
+
+    print(f"{'handler':<18}{'direct init ms':>16}{'router init ms':>16}{'router +module ms':>19}{'warm ms':>10}{'routed warm ms':>16}")
+    for m in HANDLERS:
+        print(f"{m:<18}{direct[m]['init_ms']:>16.1f}{routed[m]['init_ms']:>16.1f}{added[m]['init_ms']:>19.1f}"
+              f"{direct[m]['warm_ms']:>10.3f}{routed[m]['warm_ms']:>16.3f}")
+
+    requests = trace(args.hours, args.session_gap_minutes, args.session_length, args.think_seconds, args.seed)
+    idle_seconds = args.idle_minutes * 60
+    setups = {
+        'four functions': simulate(
+            requests, lambda m: m,
+            {'cold': {m: direct[m]['init_ms'] for m in HANDLERS}, 'warm': {m: direct[m]['warm_ms'] for m in HANDLERS}},
+            idle_seconds, args.platform_init_ms
+        ),
+        'router': simulate(
+            requests, lambda m: 'router',
+            {
+                'cold': {m: routed[m]['init_ms'] for m in HANDLERS},
+                'add': {m: added[m]['init_ms'] for m in HANDLERS},
+                'warm': {m: routed[m]['warm_ms'] for m in HANDLERS}
+            },
+            idle_seconds, args.platform_init_ms
+        )
+    }
+
+    print(f"\n{len(requests)} requests over {args.hours:g} h, {args.idle_minutes:g} min idle timeout")
+    print(f"{'deployment':<16}{'cold starts':>13}{'cold rate':>11}{'mean ms':>10}{'p99 ms':>10}")
+    for label, r in setups.items():
+        print(f"{label:<16}{r['cold']:>13}{r['cold'] / len(requests):>11.1%}{r['mean_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Mail throughput benchmark for the Flask app's SMTP transport.
+
+Starts a local SMTP stand-in that accepts and discards messages, then sends the
+same batch twice: once opening a connection per message (the old send_email
+behaviour) and once through a single reused session. The stand-in can delay its
+greeting to model the TLS handshake and login a real provider costs, and can
+drop connections to exercise the reconnect path.
+
+    python benchmarks/smtp_throughput.py [--messages 300] [--handshake-ms 150] [--drop-every 0]
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from email.mime.text import MIMEText
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib: greeting, EHLO, envelope, DATA, QUIT
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        time.sleep(self.server.handshake_ms / 1000)
+        self.reply('220 bench ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b'EHLO':
+                self.reply('250-bench')
+                self.reply('250 8BITMIME')
+            elif verb in (b'HELO', b'MAIL', b'RCPT', b'RSET', b'NOOP'):
+                self.reply('250 OK')
+            elif verb == b'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                if self.server.accept():
+                    self.reply('250 Queued')
+                else:
+                    # Simulated provider drop: the client must reconnect and resend
+                    self.reply('421 Closing connection')
+                    return
+            elif verb == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_ms, drop_every):
+        super().__init__(('127.0.0.1', 0), SinkHandler)
+        self.handshake_ms = handshake_ms
+        self.drop_every = drop_every
+        self.lock = threading.Lock()
+        self.attempts = self.received = self.connections = 0
+
+    def accept(self):
+        with self.lock:
+            self.attempts += 1
+            if self.drop_every and self.attempts % self.drop_every == 0:
+                return False
+            self.received += 1
+            return True
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+def message(n):
+    msg = MIMEText(f"Your license 'License {n}' expires soon. Please renew.")
+    msg['Subject'] = f"License 'License {n}' expires in 30 days"
+    msg['From'] = 'bench@example.com'
+    msg['To'] = f'owner{n}@example.com'
+    return msg
+
+
+def run(transport, server, count, reuse):
+    server.attempts = server.received = server.connections = 0
+    start = time.perf_counter()
+    if reuse:
+        with transport.session():
+            for n in range(count):
+                transport.send(message(n))
+    else:
+        for n in range(count):
+            transport.send(message(n))
+    elapsed = time.perf_counter() - start
+    return elapsed, server.received, server.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=300, help='messages per variant')
+    parser.add_argument('--handshake-ms', type=float, default=150, help='simulated connect + TLS + login cost')
+    parser.add_argument('--drop-every', type=int, default=0, help='drop the connection on every Nth message')
+    args = parser.parse_args()
+
+    server = SinkServer(args.handshake_ms, args.drop_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update({'SMTP_HOST': '127.0.0.1', 'SMTP_PORT': str(server.server_address[1]), 'SMTP_STARTTLS': '0'})
+    os.environ.pop('EMAIL_PASS', None)
+    sys.path.insert(0, APP_DIR)
+    import mailer
+
+    print(f"{args.messages} messages, {args.handshake_ms:.0f} ms handshake")
+    print(f"{'transport':<20}{'seconds':>10}{'msg/s':>10}{'delivered':>11}{'connections':>13}")
+    for label, reuse in (('connect per message', False), ('reused session', True)):
+        elapsed, received, connections = run(mailer.transport, server, args.messages, reuse)
+        print(f"{label:<20}{elapsed:>10.2f}{args.messages / elapsed:>10.1f}{received:>11}{connections:>13}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,31 @@
+import os
 import json
-import boto3
-
-# Initialize DynamoDB tables
-dynamodb = boto3.resource('dynamodb')
-users_table = dynamodb.Table('users')
-licenses_table = dynamodb.Table('licenses')
-
+import time
+from collections import OrderedDict
+from aws_runtime import lazy_table
+from instrumentation import instrumented
+from search_index import SEARCH_INDEX_TABLE, unindex_license
+from stats import STATS_TABLE, increment, increment_op, is_expiring_soon
+
+# DynamoDB tables (created on first use by the shared runtime)
+users_table = lazy_table('users')
+licenses_table = lazy_table('licenses')
+search_table = lazy_table(SEARCH_INDEX_TABLE)
+stats_table = lazy_table(STATS_TABLE)
+usernames_table = lazy_table(os.getenv("USERNAMES_TABLE", "usernames"))
+
+# Warm-container identity cache: user_id -> (expires_at, user item or None), LRU ordered
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "256"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "30"))
+identity_cache = OrderedDict()
+
+# Users already looked up during the current invocation: user_id -> (user item or None, read from DynamoDB)
+request_users = {}
+
+# BatchGetItem accepts at most 100 keys per call
+BATCH_GET_SIZE = 100
+
+@instrumented('admin')
 def lambda_handler(event, context):
     # Handle CORS preflight
     if event.get('httpMethod') == 'OPTIONS':
@@ -15,10 +35,9 @@ def lambda_handler(event, context):
             'body': json.dumps({'message': 'CORS preflight'})
         }
 
-    # Block deleted users globally
-    user_id, _, _ = get_current_user(event)
-    if not user_id:
-        return json_response({'error': 'User no longer exists'}, 403)
+    denied = check_caller(event)
+    if denied:
+        return denied
 
     method = event['httpMethod']
     path = event.get('path', '')
@@ -34,6 +53,15 @@ def lambda_handler(event, context):
 
     return json_response({'error': 'Not found'}, 404)
 
+def check_caller(event):
+    # Runs before every admin route (the router calls it too): starts the per-invocation
+    # user lookups afresh and blocks deleted users globally
+    request_users.clear()
+    user_id, _, _ = get_current_user(event)
+    if not user_id:
+        return json_response({'error': 'User no longer exists'}, 403)
+    return None
+
 def get_current_user(event):
     headers = event.get('headers', {})
     user_id = headers.get('x-user-id') or headers.get('X-User-ID')
@@ -42,13 +70,87 @@ def get_current_user(event):
 
     # Check if user exists in DynamoDB
     if user_id:
-        response = users_table.get_item(Key={'user_id': user_id})
-        if 'Item' not in response:
+        if get_users([user_id])[user_id] is None:
             print(f"User ID {user_id} not found in users table.")
             return None, None, None
 
     return user_id, username, role
 
+def get_users(user_ids, fresh=False):
+    # Looks users up once per invocation; the warm cache serves identity checks,
+    # while fresh=True (used before role changes) always reads DynamoDB
+    found = {}
+    missing = []
+    now = time.monotonic()
+    for user_id in dict.fromkeys(user_ids):
+        seen = request_users.get(user_id)
+        if seen and (seen[1] or not fresh):
+            found[user_id] = seen[0]
+            continue
+        cached = identity_cache.get(user_id)
+        if not fresh and cached and cached[0] > now:
+            identity_cache.move_to_end(user_id)
+            found[user_id] = cached[1]
+            request_users[user_id] = (cached[1], False)
+        else:
+            missing.append(user_id)
+
+    if len(missing) == 1:
+        fetched = {missing[0]: users_table.get_item(Key={'user_id': missing[0]}).get('Item')}
+    else:
+        fetched = batch_get_users(missing)
+
+    for user_id in missing:
+        found[user_id] = fetched.get(user_id)
+        request_users[user_id] = (found[user_id], True)
+        remember_user(user_id, found[user_id], now)
+
+    return found
+
+def batch_get_users(user_ids):
+    users = {}
+    for i in range(0, len(user_ids), BATCH_GET_SIZE):
+        request_items = {users_table.name: {'Keys': [{'user_id': user_id} for user_id in user_ids[i:i + BATCH_GET_SIZE]]}}
+        while request_items:
+            response = users_table.meta.client.batch_get_item(RequestItems=request_items)
+            for user in response.get('Responses', {}).get(users_table.name, []):
+                users[user['user_id']] = user
+            request_items = response.get('UnprocessedKeys')
+    return users
+
+def remember_user(user_id, user, now):
+    identity_cache[user_id] = (now + IDENTITY_CACHE_TTL, user)
+    identity_cache.move_to_end(user_id)
+    while len(identity_cache) > IDENTITY_CACHE_SIZE:
+        identity_cache.popitem(last=False)
+
+def invalidate_user(user_id):
+    # Called after this container deletes, promotes or demotes a user
+    identity_cache.pop(user_id, None)
+    request_users.pop(user_id, None)
+
+# At most this many admins; enforced by a conditional ADD on the stats counter
+MAX_ADMINS = 3
+
+def set_role_op(user_id, role, condition, condition_values=None):
+    return {'Update': {
+        'TableName': users_table.name,
+        'Key': {'user_id': user_id},
+        'UpdateExpression': 'SET #r = :role',
+        'ConditionExpression': condition,
+        'ExpressionAttributeNames': {'#r': 'role'},
+        'ExpressionAttributeValues': {':role': role, **(condition_values or {})}
+    }}
+
+def transact(items):
+    # Returns None on success, or the list of cancellation reason codes (one per item)
+    client = users_table.meta.client
+    try:
+        client.transact_write_items(TransactItems=items)
+        return None
+    except client.exceptions.TransactionCanceledException as e:
+        return [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+
 def promote_user(event):
     try:
         current_user_id, current_username, current_role = get_current_user(event)
@@ -59,23 +161,29 @@ def promote_user(event):
         if not target_user_id:
             return json_response({'error': 'Missing id in path'}, 400)
 
-        response = users_table.get_item(Key={'user_id': target_user_id})
-        if 'Item' not in response:
-            return json_response({'error': 'User not found'}, 404)
-
-        all_users = users_table.scan().get('Items', [])
-        admin_count = sum(1 for u in all_users if u.get('role') == 'admin')
-        if admin_count >= 3:
+        # Role change and counter increment commit together; the counter's condition
+        # holds the cap even when promotions race
+        failed = transact([
+            set_role_op(target_user_id, 'admin', 'attribute_exists(user_id) AND (attribute_not_exists(#r) OR #r <> :role)'),
+            increment_op(
+                stats_table, admin_count=1,
+                condition='attribute_not_exists(#admin_count) OR #admin_count < :max_admins',
+                condition_values={':max_admins': MAX_ADMINS}
+            )
+        ])
+        invalidate_user(target_user_id)
+
+        if failed is None:
+            return json_response({'message': 'User promoted to admin'})
+        if failed[0] == 'ConditionalCheckFailed':
+            # Missing, or already an admin
+            target_user = get_users([target_user_id], fresh=True)[target_user_id]
+            if target_user is None:
+                return json_response({'error': 'User not found'}, 404)
+            return json_response({'message': 'User promoted to admin'})
+        if failed[1] == 'ConditionalCheckFailed':
             return json_response({'error': 'Maximum number of admins reached'}, 403)
-
-        users_table.update_item(
-            Key={'user_id': target_user_id},
-            UpdateExpression='SET #r = :role',
-            ExpressionAttributeNames={'#r': 'role'},
-            ExpressionAttributeValues={':role': 'admin'}
-        )
-
-        return json_response({'message': 'User promoted to admin'})
+        return json_response({'error': f'Promotion failed: {failed}'}, 409)
     except Exception as e:
         return json_response({'error': str(e)}, 500)
 
@@ -93,32 +201,42 @@ def transfer_admin(event):
 
         if not new_admin_id:
             return json_response({'error': 'Missing id in path'}, 400)
+        if new_admin_id == current_user_id:
+            return json_response({'error': "You can't transfer the admin role to yourself"}, 400)
 
-        new_admin_response = users_table.get_item(Key={'user_id': new_admin_id})
-        current_user_response = users_table.get_item(Key={'user_id': current_user_id})
-
-        if 'Item' not in new_admin_response or 'Item' not in current_user_response:
+        # Both sides of the transfer, read fresh in one BatchGetItem
+        users = get_users([new_admin_id, current_user_id], fresh=True)
+        if users[current_user_id] is None or users[current_user_id].get('role') != 'admin':
+            return json_response({'error': 'Admin access required'}, 403)
+        new_admin = users[new_admin_id]
+        if new_admin is None:
             return json_response({'error': 'User not found'}, 404)
 
-        # Promote new admin
-        users_table.update_item(
-            Key={'user_id': new_admin_id},
-            UpdateExpression='SET #r = :role',
-            ExpressionAttributeNames={'#r': 'role'},
-            ExpressionAttributeValues={':role': 'admin'}
-        )
-        print("New admin promoted.")
-
-        # Demote current admin
-        users_table.update_item(
-            Key={'user_id': current_user_id},
-            UpdateExpression='SET #r = :role',
-            ExpressionAttributeNames={'#r': 'role'},
-            ExpressionAttributeValues={':role': 'general'}
-        )
-        print("Current admin demoted.")
-
-        return json_response({'message': 'Admin role transferred successfully'})
+        # Promote the new admin and demote the caller in one transaction. If the new
+        # admin already is one, only the demotion and a counter decrement remain.
+        was_admin = new_admin.get('role') == 'admin'
+        demote = set_role_op(current_user_id, 'general', '#r = :admin', {':admin': 'admin'})
+        if was_admin:
+            items = [increment_op(stats_table, admin_count=-1), demote]
+        else:
+            items = [
+                set_role_op(new_admin_id, 'admin', 'attribute_exists(user_id) AND (attribute_not_exists(#r) OR #r <> :role)'),
+                demote,
+                increment_op(stats_table)
+            ]
+        failed = transact(items)
+        invalidate_user(new_admin_id)
+        invalidate_user(current_user_id)
+
+        if failed is None:
+            print("Admin role transferred.")
+            return json_response({'message': 'Admin role transferred successfully'})
+        if failed[1] == 'ConditionalCheckFailed':
+            return json_response({'error': 'Admin access required'}, 403)
+        if failed[0] == 'ConditionalCheckFailed':
+            # The new admin was deleted or promoted in the meantime
+            return json_response({'error': 'User changed during transfer, please retry'}, 409)
+        return json_response({'error': f'Transfer failed: {failed}'}, 409)
     except Exception as e:
         print("Error during transfer_admin:", str(e))
         return json_response({'error': str(e)}, 500)
@@ -135,15 +253,43 @@ def delete_user(event):
         if target_user_id == current_user_id:
             return json_response({'error': "You can't delete yourself"}, 403)
 
-        response = users_table.get_item(Key={'user_id': target_user_id})
-        if 'Item' not in response:
+        target_user = get_users([target_user_id], fresh=True)[target_user_id]
+        if target_user is None:
             return json_response({'error': 'User not found'}, 404)
 
-        users_table.delete_item(Key={'user_id': target_user_id})
+        # The delete is conditional on the role read above, so the counters
+        # are adjusted for the user actually deleted
+        is_admin = target_user.get('role') == 'admin'
+        failed = transact([
+            {'Delete': {
+                'TableName': users_table.name,
+                'Key': {'user_id': target_user_id},
+                'ConditionExpression': '#r = :admin' if is_admin else 'attribute_exists(user_id) AND (attribute_not_exists(#r) OR #r <> :admin)',
+                'ExpressionAttributeNames': {'#r': 'role'},
+                'ExpressionAttributeValues': {':admin': 'admin'}
+            }},
+            increment_op(stats_table, total_users=-1, admin_count=-int(is_admin))
+        ])
+        invalidate_user(target_user_id)
+        if failed is not None:
+            return json_response({'error': 'User changed during delete, please retry'}, 409)
+
+        release_username(target_user)
         return json_response({'message': 'User deleted successfully'})
     except Exception as e:
         return json_response({'error': str(e)}, 500)
 
+def release_username(user):
+    # Frees the signup reservation, unless the name was already re-taken by another user
+    try:
+        usernames_table.delete_item(
+            Key={'username': user['username']},
+            ConditionExpression='user_id = :user_id',
+            ExpressionAttributeValues={':user_id': user['user_id']}
+        )
+    except usernames_table.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+
 def delete_license(event):
     try:
         current_user_id, current_username, current_role = get_current_user(event)
@@ -159,6 +305,17 @@ def delete_license(event):
             return json_response({'error': 'License not found'}, 404)
 
         licenses_table.delete_item(Key={'license_id': license_id})
+        increment(
+            stats_table,
+            total_licenses=-1,
+            expiring_soon=-int(is_expiring_soon(response['Item'].get('expiry_date')))
+        )
+
+        try:
+            unindex_license(search_table, response['Item'])
+        except Exception as e:
+            print(f"Search index error for {license_id}: {e}")
+
         return json_response({'message': 'License deleted successfully'})
     except Exception as e:
         return json_response({'error': str(e)}, 500)
@@ -1,10 +1,21 @@
+import os
 import json
-import boto3
 import re
 import uuid
+from boto3.dynamodb.conditions import Key
+from aws_runtime import lazy_table
+from instrumentation import instrumented
+from stats import STATS_TABLE, increment, scan_all
 
-dynamodb = boto3.resource('dynamodb')
-users_table = dynamodb.Table('users')
+# One item per taken username; the conditional put on it enforces uniqueness
+USERNAMES_TABLE = os.getenv("USERNAMES_TABLE", "usernames")
+
+# Marker in the stats table claimed by the account that becomes the first admin
+FIRST_ADMIN_KEY = {'stat_id': 'first_admin'}
+
+users_table = lazy_table('users')
+usernames_table = lazy_table(USERNAMES_TABLE)
+stats_table = lazy_table(STATS_TABLE)
 
 def is_valid_username(username):
     return re.match(r'^[a-zA-Z0-9_]{3,20}$', username) is not None
@@ -12,6 +23,7 @@ def is_valid_username(username):
 def is_valid_password(password):
     return len(password) >= 6
 
+@instrumented('auth_handler')
 def lambda_handler(event, context):
     # Handle CORS preflight
     if event.get('httpMethod') == 'OPTIONS':
@@ -36,25 +48,36 @@ def lambda_handler(event, context):
         return json_response({"error": "Invalid password"}, 400)
 
     if action == 'signup':
-        # Check if username exists
-        response = users_table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('username').eq(username)
-        )
-        if response.get('Count', 0) > 0:
-            return json_response({"error": "Username already exists"}, 409)
+        user_id = str(uuid.uuid4())
 
-        # First user becomes admin
-        scan = users_table.scan(Select='COUNT')
-        role = 'admin' if scan['Count'] == 0 else 'general'
+        # Reserve the username; fails if it is already taken
+        try:
+            reserve_username(username, user_id)
+        except usernames_table.meta.client.exceptions.ConditionalCheckFailedException:
+            return json_response({"error": "Username already exists"}, 409)
 
-        user_id = str(uuid.uuid4())
+        # First user becomes admin. The counter alone can't decide it: it reads 1 on any
+        # deployment whose stats item was never seeded.
+        total_users = increment(stats_table, total_users=1)['total_users']
+        is_first_admin = total_users == 1 and claim_first_admin(user_id)
+        role = 'admin' if is_first_admin else 'general'
 
-        users_table.put_item(Item={
-            'user_id': user_id,
-            'username': username,
-            'password': password,
-            'role': role
-        })
+        try:
+            users_table.put_item(Item={
+                'user_id': user_id,
+                'username': username,
+                'password': password,
+                'role': role
+            })
+        except Exception:
+            # Undo the reservation and the count so the name can be retried
+            increment(stats_table, total_users=-1)
+            usernames_table.delete_item(Key={'username': username})
+            if is_first_admin:
+                stats_table.delete_item(Key=FIRST_ADMIN_KEY)
+            raise
+        # Always written: its version bump lands after the user exists
+        increment(stats_table, admin_count=int(role == 'admin'))
 
         return json_response({
             "message": "Signup successful",
@@ -65,8 +88,9 @@ def lambda_handler(event, context):
 
     elif action == 'login':
         # Find user by username
-        response = users_table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('username').eq(username)
+        response = users_table.query(
+            IndexName='username-index',
+            KeyConditionExpression=Key('username').eq(username)
         )
         items = response.get('Items', [])
         user = items[0] if items else None
@@ -83,6 +107,37 @@ def lambda_handler(event, context):
 
     return json_response({"error": "Invalid action"}, 400)
 
+def reserve_username(username, user_id):
+    usernames_table.put_item(
+        Item={'username': username, 'user_id': user_id},
+        ConditionExpression='attribute_not_exists(username)'
+    )
+
+def claim_first_admin(user_id):
+    # Only while the users table is empty; the conditional put on the marker
+    # settles concurrent first signups
+    if users_table.scan(Limit=1, ProjectionExpression='user_id').get('Items'):
+        return False
+    try:
+        stats_table.put_item(
+            Item={**FIRST_ADMIN_KEY, 'user_id': user_id},
+            ConditionExpression='attribute_not_exists(stat_id)'
+        )
+    except stats_table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+def backfill_reservations():
+    # Reserves the usernames of users created before the usernames table existed
+    reserved = 0
+    for user in scan_all(users_table, ProjectionExpression='user_id, username'):
+        try:
+            reserve_username(user['username'], user['user_id'])
+            reserved += 1
+        except usernames_table.meta.client.exceptions.ConditionalCheckFailedException:
+            continue
+    print(f"Reserved {reserved} usernames")
+
 def json_response(data, status_code=200):
     return {
         "statusCode": status_code,
@@ -93,4 +148,7 @@ def json_response(data, status_code=200):
             "Access-Control-Allow-Headers": "Content-Type, X-User-ID, X-Username, X-Role, x-user-id, x-username, x-role, Authorization"
         },
         "body": json.dumps(data)
-    }
\ No newline at end of file
+    }
+
+if __name__ == '__main__':
+    backfill_reservations()
@@ -0,0 +1,76 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+import instrumentation
+
+# Shared AWS client layer for the Lambda functions. Clients and resources are
+# created on first use and then reused by every invocation the container serves.
+
+BOTO_CONFIG = Config(
+    max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50")),
+    tcp_keepalive=True,
+    connect_timeout=float(os.getenv("AWS_CONNECT_TIMEOUT", "2")),
+    read_timeout=float(os.getenv("AWS_READ_TIMEOUT", "10")),
+    retries={
+        'mode': os.getenv("AWS_RETRY_MODE", "standard"),
+        'max_attempts': int(os.getenv("AWS_MAX_ATTEMPTS", "3"))
+    }
+)
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_resources = {}
+
+def session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session()
+            instrumentation.register(_session)
+        return _session
+
+def client(service):
+    # Clients are thread-safe and shared across threads
+    if service not in _clients:
+        aws_session = session()
+        with _lock:
+            if service not in _clients:
+                _clients[service] = aws_session.client(service, config=BOTO_CONFIG)
+    return _clients[service]
+
+def resource(service):
+    # Resources are not thread-safe: use new_resource() from worker threads
+    if service not in _resources:
+        aws_session = session()
+        with _lock:
+            if service not in _resources:
+                _resources[service] = aws_session.resource(service, config=BOTO_CONFIG)
+    return _resources[service]
+
+def new_resource(service):
+    # A private resource on its own session, for use from a worker thread
+    worker_session = boto3.session.Session()
+    instrumentation.register(worker_session)
+    return worker_session.resource(service, config=BOTO_CONFIG)
+
+def table(name):
+    return resource('dynamodb').Table(name)
+
+class Lazy:
+    # Stands in for a client or table at module level and builds it on first attribute access
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+
+    def __getattr__(self, name):
+        if self._target is None:
+            self._target = self._factory()
+        return getattr(self._target, name)
+
+def lazy_table(name):
+    return Lazy(lambda: table(name))
+
+def lazy_client(service):
+    return Lazy(lambda: client(service))
@@ -1,7 +1,25 @@
 import json
-import boto3
-from datetime import datetime
+import base64
+import bisect
+import gzip
+import hashlib
+import os
+from aws_runtime import lazy_table
+from instrumentation import instrumented
+from boto3.dynamodb.conditions import Attr
+from datetime import datetime, timedelta
+from expiry_index import EXPIRY_INDEX_NAME, lookback_start, query_expiring
+from license_snapshot import SNAPSHOT_ENABLED, snapshot
+from search_index import MIN_QUERY_LENGTH, SEARCH_INDEX_TABLE, candidate_ids, fetch_licenses, rank
+from stats import EXPIRING_SOON_DAYS, STATS_TABLE, get_stats, is_expiring_soon, scan_all
 
+# DynamoDB tables (created on first use by the shared runtime)
+licenses_table = lazy_table('licenses')
+users_table = lazy_table('users')
+search_table = lazy_table(SEARCH_INDEX_TABLE) if SEARCH_INDEX_TABLE else None
+stats_table = lazy_table(STATS_TABLE)
+
+@instrumented('dashboard')
 def lambda_handler(event, context):
     print("Dashboard Lambda starting...")
 
@@ -15,15 +33,11 @@ def lambda_handler(event, context):
         }
 
     try:
-        dynamodb = boto3.resource('dynamodb')
-        licenses_table = dynamodb.Table('licenses')
-        users_table = dynamodb.Table('users')
-
         method = event['httpMethod']
         path = event.get('path', '')
 
         if method == 'GET' and path.endswith('/dashboard'):
-            return handle_dashboard(headers, licenses_table, users_table, event)
+            return handle_dashboard(headers, licenses_table, users_table, stats_table, event, search_table)
 
         return json_response({'error': 'Not found'}, 404)
 
@@ -31,59 +45,287 @@ def lambda_handler(event, context):
         print(f"Error: {str(e)}")
         return json_response({'error': 'Internal server error'}, 500)
 
-def handle_dashboard(headers, licenses_table, users_table, event):
+# Pagination: page size bounds for ?limit=
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Items read per scan call while filtering by ?query=
+SEARCH_SCAN_PAGE_SIZE = 1000
+
+# Attributes a client may request with ?fields=
+LICENSE_FIELDS = {
+    'license_id', 'name', 'expiry_date', 'primary_email', 'primary_owner',
+    'secondary_email', 'secondary_owner', 'created_by', 'created_by_username',
+    'created_at', 'last_updated_by', 'last_updated_on'
+}
+SEARCH_FIELDS = ('name', 'primary_owner', 'secondary_owner')
+# Ranked results kept per warm container for the search-index path
+SEARCH_CACHE_ENTRIES = 32
+
+# Bodies at least this large are gzipped for clients that accept it; 0 turns it off
+GZIP_MIN_BYTES = int(os.getenv("DASHBOARD_GZIP_MIN_BYTES", "2048"))
+# API Gateway returns a base64 body as binary only when the request's Accept header
+# matches the API's binaryMediaTypes (see api-gw.yml), so only requests asking for
+# this type get gzip; other clients keep getting plain JSON
+GZIP_MEDIA_TYPE = 'application/vnd.license-tracker+json'
+
+# Utility: opaque pagination token wrapping a DynamoDB start key, a result
+# offset (snapshot search) or the last result's rank (index search)
+def encode_cursor(start_key):
+    return base64.urlsafe_b64encode(json.dumps(start_key, default=str).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, cursor_key):
+    try:
+        start_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(start_key, dict) or set(start_key) != {cursor_key}:
+        raise ValueError('Invalid cursor')
+    if cursor_key == 'offset' and (not isinstance(start_key['offset'], int) or start_key['offset'] < 0):
+        raise ValueError('Invalid cursor')
+    if cursor_key == 'after' and not (
+        isinstance(start_key['after'], list) and len(start_key['after']) == 3
+        and isinstance(start_key['after'][0], int) and all(isinstance(v, str) for v in start_key['after'][1:])
+    ):
+        raise ValueError('Invalid cursor')
+    return start_key
+
+def parse_page_params(query_params, cursor_key='license_id'):
+    limit = int(query_params.get('limit') or DEFAULT_PAGE_SIZE)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    cursor = query_params.get('cursor')
+    start_key = decode_cursor(cursor, cursor_key) if cursor else None
+
+    fields = None
+    if query_params.get('fields'):
+        fields = {field.strip() for field in query_params['fields'].split(',') if field.strip()}
+        unknown = fields - LICENSE_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields.add('license_id')
+
+    return limit, start_key, fields
+
+def matches_query(lic, query):
+    return any(query in lic.get(field, '').lower() for field in SEARCH_FIELDS)
+
+def scan_licenses_page(licenses_table, limit, start_key, fields, query):
+    # Returns up to `limit` licenses plus the start key of the next page (or None).
+    # The next-page key is the last returned item's key, so a page can end mid-scan.
+    scan_kwargs = {'Limit': SEARCH_SCAN_PAGE_SIZE if query else limit}
+    if fields:
+        projected = fields | set(SEARCH_FIELDS) if query else fields
+        names = {f'#f{i}': field for i, field in enumerate(sorted(projected))}
+        scan_kwargs['ProjectionExpression'] = ', '.join(names)
+        scan_kwargs['ExpressionAttributeNames'] = names
+    if start_key:
+        scan_kwargs['ExclusiveStartKey'] = start_key
+
+    licenses = []
+    while True:
+        response = licenses_table.scan(**scan_kwargs)
+        for lic in response.get('Items', []):
+            if query and not matches_query(lic, query):
+                continue
+            licenses.append({k: v for k, v in lic.items() if k in fields} if fields else lic)
+            if len(licenses) == limit:
+                return licenses, {'license_id': lic['license_id']}
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return licenses, None
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+def count_expiring_matches(licenses_table, query, today):
+    # Exact expiring-soon count for a scan-path search, whose pages only cover part of
+    # the matches: reads just the licenses in the expiring-soon window
+    names = {f'#f{i}': field for i, field in enumerate(SEARCH_FIELDS + ('expiry_date',))}
+    projection = {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+    end = today + timedelta(days=EXPIRING_SOON_DAYS)
+    if EXPIRY_INDEX_NAME:
+        items = (lic for page in query_expiring(licenses_table, lookback_start(today), end, **projection)
+                 for lic in page.get('Items', []))
+    else:
+        items = scan_all(licenses_table, FilterExpression=Attr('expiry_date').lte(end.isoformat()), **projection)
+    return sum(1 for lic in items if matches_query(lic, query))
+
+# (query, stats version) -> ([rank key], [expiry_date]) of the matches, in rank order.
+# The version changes with every write, so an entry is never stale.
+search_results = {}
+
+def ranked_matches(licenses_table, search_table, query, version):
+    # Index lookups + intersection, then a substring re-check and ranking, done once per
+    # query and version in a warm container; only the searchable fields are read
+    key = (query, version)
+    if key not in search_results:
+        ids = candidate_ids(search_table, query)
+        projection = set(SEARCH_FIELDS) | {'license_id', 'expiry_date'}
+        matches = [lic for lic in fetch_licenses(licenses_table, ids, projection) if matches_query(lic, query)]
+        matches.sort(key=lambda lic: rank(lic, query))
+        print(f"Search '{query}': {len(ids)} candidates, {len(matches)} matches")
+        if len(search_results) >= SEARCH_CACHE_ENTRIES:
+            search_results.pop(next(iter(search_results)))
+        search_results[key] = ([rank(lic, query) for lic in matches], [lic.get('expiry_date') for lic in matches])
+    return search_results[key]
+
+def search_licenses_page(licenses_table, search_table, limit, start_key, fields, query, version):
+    # Pages resume after the last result's rank key, so they hold even when another
+    # container serves them. Returns the page, the next-page key (or None) and the
+    # expiry dates of all matches.
+    ranks, expiry_dates = ranked_matches(licenses_table, search_table, query, version)
+    start = bisect.bisect_right(ranks, tuple(start_key['after'])) if start_key else 0
+    page_ranks = ranks[start:start + limit]
+
+    page_ids = [license_id for _, _, license_id in page_ranks]
+    by_id = {lic['license_id']: lic for lic in fetch_licenses(licenses_table, page_ids, fields)}
+    page = [by_id[license_id] for license_id in page_ids if license_id in by_id]
+    next_key = {'after': list(page_ranks[-1])} if start + limit < len(ranks) else None
+    return page, next_key, expiry_dates
+
+def snapshot_licenses_page(licenses_table, limit, start_key, fields, query, version=None):
+    # Matches and ranks against the warm columnar snapshot, then reads only the
+    # page's items. Returns the page, the next-page offset (or None) and the matched rows.
+    snapshot.refresh(licenses_table, version)
+    rows = snapshot.search(query)
+    print(f"Snapshot search '{query}': {len(rows)} of {len(snapshot)} licenses match")
+
+    offset = start_key['offset'] if start_key else 0
+    page_ids = [snapshot.ids[row] for row in rows[offset:offset + limit]]
+    by_id = {lic['license_id']: lic for lic in fetch_licenses(licenses_table, page_ids, fields)}
+    # Licenses deleted since the snapshot was taken
+    snapshot.discard(set(page_ids) - set(by_id))
+
+    page = [by_id[license_id] for license_id in page_ids if license_id in by_id]
+    next_key = {'offset': offset + limit} if offset + limit < len(rows) else None
+    return page, next_key, rows
+
+# Conditional GET: the ETag combines the stats item's version, which every write bumps,
+# with everything else the response depends on, so an unchanged dashboard costs one
+# GetItem and a 304
+def dashboard_etag(version, headers, query_params, today):
+    # Admins get the user list minus themselves, and search counts depend on the date
+    key = json.dumps([
+        headers.get('x-role'), headers.get('x-username'), sorted(query_params.items()), today.isoformat()
+    ])
+    # Weak: the gzipped and plain bodies are the same dashboard
+    return f'W/"{version}-{hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]}"'
+
+def opaque_tag(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match is '*' or a list of tags, compared weakly
+    tags = {opaque_tag(tag) for tag in if_none_match.split(',')}
+    return '*' in tags or opaque_tag(etag) in tags
+
+def handle_dashboard(headers, licenses_table, users_table, stats_table, event, search_table=None):
     print("Handling dashboard request")
 
     query_params = event.get('queryStringParameters', {}) or {}
     query = query_params.get('query', '').strip().lower()
+    use_snapshot = bool(query and SNAPSHOT_ENABLED)
+    use_search_index = bool(query and search_table and len(query) >= MIN_QUERY_LENGTH) and not use_snapshot
 
     try:
-        response = licenses_table.scan()
-        all_licenses = response.get('Items', [])
-        print(f"Found {len(all_licenses)} licenses")
+        limit, start_key, fields = parse_page_params(
+            query_params, 'offset' if use_snapshot else 'after' if use_search_index else 'license_id'
+        )
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    # Aggregates come from the stats item rather than scanning both tables; it is read
+    # for every page since its version keys the ETag, but summary figures only
+    # accompany the first page
+    try:
+        stats = get_stats(stats_table)
     except Exception as e:
-        return json_response({'error': f'DynamoDB scan error (licenses): {str(e)}'}, 500)
-
-    # Filter licenses by name or either owner's name
-    if query:
-        licenses = [
-            lic for lic in all_licenses
-            if query in lic.get('name', '').lower()
-            or query in lic.get('primary_owner', '').lower()
-            or query in lic.get('secondary_owner', '').lower()
-        ]
-    else:
-        licenses = all_licenses
+        return json_response({'error': f'DynamoDB read error (stats): {str(e)}'}, 500)
 
     today = datetime.today().date()
-    expiring_soon = 0
-    for lic in licenses:
-        expiry_str = lic.get('expiry_date')
-        try:
-            expiry = datetime.strptime(expiry_str, "%Y-%m-%d").date()
-            if (expiry - today).days <= 30:
-                expiring_soon += 1
-        except ValueError:
-            continue
+    etag = dashboard_etag(stats['version'], headers, query_params, today)
+    if etag_matches(headers.get('if-none-match', ''), etag):
+        print("Dashboard not modified")
+        return not_modified(etag)
 
     try:
-        users_response = users_table.scan()
-        all_users = users_response.get('Items', [])
-        print(f"Found {len(all_users)} users")
+        if use_snapshot:
+            licenses, next_key, matched = snapshot_licenses_page(
+                licenses_table, limit, start_key, fields, query, stats['version']
+            )
+        elif use_search_index:
+            licenses, next_key, matched = search_licenses_page(
+                licenses_table, search_table, limit, start_key, fields, query, stats['version']
+            )
+        else:
+            licenses, next_key = scan_licenses_page(licenses_table, limit, start_key, fields, query)
+            matched = None
+        print(f"Returning {len(licenses)} licenses")
     except Exception as e:
-        return json_response({'error': f'DynamoDB scan error (users): {str(e)}'}, 500)
-
-    current_username = headers.get('x-username', '')
-    users = [user for user in all_users if user.get('username') != current_username]
-    admin_count = sum(1 for user in all_users if user.get('role') == 'admin')
+        return json_response({'error': f'DynamoDB read error (licenses): {str(e)}'}, 500)
 
-    return json_response({
+    result = {
         'licenses': licenses,
+        'next_cursor': encode_cursor(next_key) if next_key else None
+    }
+
+    if start_key:
+        return dashboard_response(result, headers, etag)
+
+    expiring_soon = stats['expiring_soon']
+    if use_snapshot:
+        expiring_soon = snapshot.count_expiring_soon(matched, today, EXPIRING_SOON_DAYS)
+    elif use_search_index:
+        expiring_soon = sum(1 for expiry_date in matched if is_expiring_soon(expiry_date, today))
+    elif query:
+        try:
+            expiring_soon = count_expiring_matches(licenses_table, query, today)
+        except Exception as e:
+            return json_response({'error': f'DynamoDB read error (licenses): {str(e)}'}, 500)
+
+    # Only admins get the user list (the frontend renders it for admins only)
+    users = []
+    if headers.get('x-role') == 'admin':
+        try:
+            all_users = list(scan_all(users_table))
+            print(f"Found {len(all_users)} users")
+        except Exception as e:
+            return json_response({'error': f'DynamoDB scan error (users): {str(e)}'}, 500)
+
+        current_username = headers.get('x-username', '')
+        users = [user for user in all_users if user.get('username') != current_username]
+
+    result.update({
         'users': users,
         'expiring_soon': expiring_soon,
-        'total_users': len(all_users),
-        'admin_count': admin_count
+        'total_licenses': stats['total_licenses'],
+        'total_users': stats['total_users'],
+        'admin_count': stats['admin_count']
     })
+    return dashboard_response(result, headers, etag)
+
+def dashboard_response(data, headers, etag):
+    # JSON with the ETag, gzipped when it is large and the client can take it
+    response = json_response(data)
+    response['headers'].update(cache_headers(etag))
+    body = response['body'].encode('utf-8')
+    accepts_gzip = 'gzip' in headers.get('accept-encoding', '').lower() and GZIP_MEDIA_TYPE in headers.get('accept', '')
+    if GZIP_MIN_BYTES and len(body) >= GZIP_MIN_BYTES and accepts_gzip:
+        response['headers']['Content-Encoding'] = 'gzip'
+        response['body'] = base64.b64encode(gzip.compress(body, compresslevel=6)).decode('ascii')
+        response['isBase64Encoded'] = True
+    return response
+
+def not_modified(etag):
+    headers = cors_headers()
+    del headers['Content-Type']
+    headers.update(cache_headers(etag))
+    return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+def cache_headers(etag):
+    # Clients may keep the body but must revalidate it before every use
+    return {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept, Accept-Encoding'}
 
 def json_response(data, status_code=200):
     return {
@@ -97,7 +339,8 @@ def cors_headers():
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, X-User-ID, X-Username, X-Role, x-user-id, x-username, x-role, Authorization',
+        'Access-Control-Allow-Headers': 'Content-Type, X-User-ID, X-Username, X-Role, x-user-id, x-username, x-role, Authorization, If-None-Match',
+        'Access-Control-Expose-Headers': 'ETag',
         'Strict-Transport-Security': 'max-age=63072000; includeSubDomains; preload',
         'X-Content-Type-Options': 'nosniff',
         'X-Frame-Options': 'DENY'
@@ -0,0 +1,89 @@
+import os
+import sys
+from datetime import datetime, date
+from aws_runtime import table
+from boto3.dynamodb.conditions import Key, Attr
+
+# GSI on the licenses table: expiry_month (YYYY-MM) hash key, expiry_date range key
+EXPIRY_INDEX_NAME = os.getenv("EXPIRY_INDEX_NAME", "expiry-index")
+
+# How far back the index queries look for already-expired licenses
+EXPIRY_LOOKBACK_MONTHS = int(os.getenv("EXPIRY_LOOKBACK_MONTHS", "24"))
+
+# Utility: bucket attribute for an expiry date string (YYYY-MM-DD -> YYYY-MM)
+def expiry_bucket(expiry_str):
+    return expiry_str[:7]
+
+def lookback_start(today):
+    # First day of the oldest month bucket the index queries cover
+    months = today.year * 12 + today.month - 1 - EXPIRY_LOOKBACK_MONTHS
+    return date(months // 12, months % 12 + 1, 1)
+
+def month_buckets(start, end):
+    buckets = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        buckets.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets
+
+def query_expiring(licenses_table, start, end, buckets=None, **query_kwargs):
+    # Generator: yields pages of licenses with start <= expiry_date <= end,
+    # optionally restricted to some of the month buckets the range covers
+    for bucket in buckets or month_buckets(start, end):
+        kwargs = dict(query_kwargs)
+        kwargs['IndexName'] = EXPIRY_INDEX_NAME
+        kwargs['KeyConditionExpression'] = (
+            Key('expiry_month').eq(bucket) &
+            Key('expiry_date').between(start.isoformat(), end.isoformat())
+        )
+        while True:
+            response = licenses_table.query(**kwargs)
+            yield response
+
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            kwargs['ExclusiveStartKey'] = last_key
+
+def count_expiring(licenses_table, start, end):
+    return sum(page.get('Count', 0) for page in query_expiring(licenses_table, start, end, Select='COUNT'))
+
+def backfill(licenses_table):
+    # Adds expiry_month to licenses written before the index existed
+    scan_kwargs = {
+        'ProjectionExpression': 'license_id, expiry_date',
+        'FilterExpression': Attr('expiry_date').exists() & Attr('expiry_month').not_exists()
+    }
+    updated = 0
+    while True:
+        response = licenses_table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            try:
+                datetime.strptime(item['expiry_date'], "%Y-%m-%d")
+            except ValueError:
+                print(f"Skipping {item['license_id']}: invalid expiry_date {item['expiry_date']}")
+                continue
+            try:
+                licenses_table.update_item(
+                    Key={'license_id': item['license_id']},
+                    UpdateExpression='SET expiry_month = :bucket',
+                    ConditionExpression=Attr('expiry_date').eq(item['expiry_date']),
+                    ExpressionAttributeValues={':bucket': expiry_bucket(item['expiry_date'])}
+                )
+                updated += 1
+            except licenses_table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Renewed or deleted since the scan; the write path set the bucket itself
+                continue
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+    print(f"Backfilled expiry_month on {updated} licenses")
+    return updated
+
+if __name__ == '__main__':
+    table_name = sys.argv[1] if len(sys.argv) > 1 else 'licenses'
+    backfill(table(table_name))
@@ -0,0 +1,231 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Per-invocation metrics for the Lambda handlers: handler duration, every AWS call
+# (timed through botocore events on the shared session) and outbound HTTP call, and the
+# DynamoDB capacity each call consumed. Emitted as CloudWatch embedded metric format
+# (EMF) JSON lines, which CloudWatch Logs turns into metrics without any API calls.
+
+# Set METRICS=0 to turn the instrumentation off
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "LicenseTracker")
+# Adds ReturnConsumedCapacity=TOTAL to DynamoDB calls that don't ask for it themselves
+CAPTURE_CAPACITY = METRICS_ENABLED and os.getenv("METRICS_CONSUMED_CAPACITY", "1") != "0"
+
+# Sampling profiler: this fraction of invocations runs under cProfile, and the profile
+# is logged when the invocation took at least PROFILE_SLOW_MS. 0 (the default) disables it.
+# Only the handler's own thread is profiled, not the notification fan-out workers.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "30"))
+
+cold_start = True
+
+
+class Recorder:
+    # Calls made during the current invocation, including from worker threads
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+            self.properties = {}
+
+    def record(self, kind, name, elapsed_ms, read_units=0.0, write_units=0.0, error=False):
+        with self.lock:
+            stats = self.calls.setdefault((kind, name), {'count': 0, 'ms': 0.0, 'rcu': 0.0, 'wcu': 0.0, 'errors': 0})
+            stats['count'] += 1
+            stats['ms'] += elapsed_ms
+            stats['rcu'] += read_units
+            stats['wcu'] += write_units
+            stats['errors'] += int(error)
+
+    def totals(self, kind):
+        with self.lock:
+            calls = [stats for (call_kind, _), stats in self.calls.items() if call_kind == kind]
+        return {
+            'count': sum(s['count'] for s in calls),
+            'ms': sum(s['ms'] for s in calls),
+            'rcu': sum(s['rcu'] for s in calls),
+            'wcu': sum(s['wcu'] for s in calls),
+            'errors': sum(s['errors'] for s in calls)
+        }
+
+
+recorder = Recorder()
+# Set while an instrumented handler runs; handlers called from another one (the router)
+# are part of the outer invocation's record
+active = False
+
+def annotate(**properties):
+    # Extra properties for the current invocation's record, e.g. the matched route
+    with recorder.lock:
+        recorder.properties.update(properties)
+
+
+def capacity_units(consumed):
+    # (read, write) units from a response's ConsumedCapacity (a dict, or a list for batch calls)
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    read = write = 0.0
+    for capacity in consumed or []:
+        read_units = capacity.get('ReadCapacityUnits')
+        write_units = capacity.get('WriteCapacityUnits')
+        if read_units is None and write_units is None:
+            # Only CapacityUnits is reported when a call touched just one kind
+            read_units = capacity.get('CapacityUnits', 0.0)
+        read += read_units or 0.0
+        write += write_units or 0.0
+    return read, write
+
+
+# botocore event handlers, registered on every session the runtime creates
+
+WRITE_OPERATIONS = {'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'}
+
+def request_capacity(params, model, **kwargs):
+    if 'ReturnConsumedCapacity' in model.input_shape.members:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+def call_started(model, context, **kwargs):
+    name = f"{model.service_model.service_name}.{model.name}"
+    context['instrumentation_call'] = (name, model.name in WRITE_OPERATIONS, time.perf_counter())
+
+def call_finished(context, http_response=None, parsed=None, exception=None, **kwargs):
+    # after-call (any response, errors included) or after-call-error (no response at all)
+    call = context.pop('instrumentation_call', None)
+    if call is None:
+        return
+    name, is_write, started = call
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    read, write = capacity_units((parsed or {}).get('ConsumedCapacity'))
+    if is_write and read and not write:
+        read, write = 0.0, read
+    failed = exception is not None or (http_response is not None and http_response.status_code >= 400)
+    recorder.record('aws', name, elapsed_ms, read, write, failed)
+
+def register(session):
+    # Called by aws_runtime for each boto3 session it creates
+    if not METRICS_ENABLED:
+        return
+    if CAPTURE_CAPACITY:
+        session.events.register('before-parameter-build.dynamodb', request_capacity)
+    session.events.register('before-call', call_started)
+    session.events.register('after-call', call_finished)
+    session.events.register('after-call-error', call_finished)
+
+
+@contextmanager
+def timed_http(name):
+    # Times a non-AWS HTTP call, e.g. the Teams webhook
+    started = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        if METRICS_ENABLED:
+            recorder.record('http', name, (time.perf_counter() - started) * 1000, error=failed)
+
+
+# Emitting
+
+def emf_record(metrics, dimensions, properties=None):
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (unit, _) in metrics.items()]
+            }]
+        },
+        **dimensions,
+        **{name: value for name, (_, value) in metrics.items()},
+        **(properties or {})
+    }
+    return json.dumps(record, default=str)
+
+def emit(function, duration_ms, status_code, was_cold):
+    aws = recorder.totals('aws')
+    http = recorder.totals('http')
+    print(emf_record(
+        {
+            'Duration': ('Milliseconds', round(duration_ms, 3)),
+            'AWSCalls': ('Count', aws['count']),
+            'AWSTime': ('Milliseconds', round(aws['ms'], 3)),
+            'AWSErrors': ('Count', aws['errors']),
+            'ConsumedRCU': ('Count', aws['rcu']),
+            'ConsumedWCU': ('Count', aws['wcu']),
+            'HTTPCalls': ('Count', http['count']),
+            'HTTPTime': ('Milliseconds', round(http['ms'], 3))
+        },
+        {'Function': function},
+        {'StatusCode': status_code, 'ColdStart': was_cold, **recorder.properties}
+    ))
+    # One record per operation, dimensioned by Function and Call
+    with recorder.lock:
+        calls = sorted(recorder.calls.items())
+    for (kind, name), stats in calls:
+        print(emf_record(
+            {
+                'Calls': ('Count', stats['count']),
+                'CallTime': ('Milliseconds', round(stats['ms'], 3)),
+                'CallErrors': ('Count', stats['errors']),
+                'ConsumedRCU': ('Count', stats['rcu']),
+                'ConsumedWCU': ('Count', stats['wcu'])
+            },
+            {'Function': function, 'Call': name},
+            {'CallType': kind}
+        ))
+
+
+def log_profile(function, profiler, duration_ms):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    print(f"Profile for slow {function} invocation ({duration_ms:.0f} ms):\n{out.getvalue()}")
+
+
+def instrumented(function):
+    # Decorator for a lambda_handler: resets the per-invocation recorder, times the
+    # handler, emits the metric records and, when sampled, profiles it
+    def decorate(handler):
+        @wraps(handler)
+        def wrapper(event, context):
+            global active, cold_start
+            if not METRICS_ENABLED or active:
+                return handler(event, context)
+
+            was_cold, cold_start, active = cold_start, False, True
+            recorder.reset()
+            profiler = cProfile.Profile() if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE else None
+            response = None
+            started = time.perf_counter()
+            try:
+                if profiler:
+                    response = profiler.runcall(handler, event, context)
+                else:
+                    response = handler(event, context)
+                return response
+            finally:
+                active = False
+                duration_ms = (time.perf_counter() - started) * 1000
+                status_code = response.get('statusCode') if isinstance(response, dict) else None
+                try:
+                    emit(function, duration_ms, status_code, was_cold)
+                    if profiler and duration_ms >= PROFILE_SLOW_MS:
+                        log_profile(function, profiler, duration_ms)
+                except Exception as e:
+                    print(f"Metrics error: {e}")
+        return wrapper
+    return decorate
@@ -1,12 +1,24 @@
+import base64
+import csv
+import io
 import json
+import os
 import uuid
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import boto3
+from aws_runtime import lazy_table
+from instrumentation import instrumented
+from expiry_index import expiry_bucket
+from license_snapshot import change_stamp
+from search_index import SEARCH_INDEX_TABLE, index_license, index_licenses
+from stats import STATS_TABLE, increment, is_expiring_soon, expiring_delta
 
-# Initialize DynamoDB table
-dynamodb = boto3.resource('dynamodb')
-licenses_table = dynamodb.Table('licenses')
+# DynamoDB tables (created on first use by the shared runtime)
+licenses_table = lazy_table('licenses')
+search_table = lazy_table(SEARCH_INDEX_TABLE)
+stats_table = lazy_table(STATS_TABLE)
 
 # Utility: validate email format
 def is_valid_email(email):
@@ -33,6 +45,7 @@ def json_response(data, status_code=200):
         'body': json.dumps(data, default=str)
     }
 
+@instrumented('license_manager')
 def lambda_handler(event, context):
     # Handle preflight OPTIONS request
     if event.get('httpMethod') == 'OPTIONS':
@@ -52,6 +65,12 @@ def lambda_handler(event, context):
 
     if path == '/licenses' and method == 'POST':
         return add_license(event)
+    elif path == '/licenses/bulk' and method == 'POST':
+        return bulk_import(event)
+    elif path == '/licenses/export' and method == 'GET':
+        return export_licenses(event)
+    elif path == '/licenses' and method == 'PUT':
+        return batch_renew(event)
     elif path.startswith('/licenses/') and method == 'PUT':
         return update_license(event)
 
@@ -64,40 +83,58 @@ def get_current_user(event):
     role = headers.get('x-role') or headers.get('X-Role')
     return user_id, username, role
 
+def build_license(record, user_id, username):
+    # Validated license item from an add request body or an import row.
+    # Returns (item, error); a missing field raises KeyError.
+    name = record['license_name'].strip()
+    expiry = record['expiry_date'].strip()
+    primary_email = record['primary_owner_email'].strip()
+    primary_owner = record['primary_owner_name'].strip()
+    secondary_email = record['secondary_owner_email'].strip()
+    secondary_owner = record['secondary_owner_name'].strip()
+
+    # Validate emails and date
+    if not is_valid_email(primary_email):
+        return None, 'Invalid primary email format'
+    if not is_valid_email(secondary_email):
+        return None, 'Invalid secondary email format'
+    if not is_valid_date(expiry):
+        return None, 'Invalid date format'
+
+    item = {
+        'license_id': str(uuid.uuid4()),
+        'name': name,
+        'expiry_date': expiry,
+        'expiry_month': expiry_bucket(expiry),
+        'primary_email': primary_email,
+        'primary_owner': primary_owner,
+        'secondary_email': secondary_email,
+        'secondary_owner': secondary_owner,
+        'created_by': user_id,
+        'created_by_username': username,
+        'created_at': datetime.now().isoformat(),
+        **change_stamp()
+    }
+    return item, None
+
 def add_license(event):
     try:
         current_user_id, current_username, current_role = get_current_user(event)
 
         body = json.loads(event['body'])
-        name = body['license_name'].strip()
-        expiry = body['expiry_date'].strip()
-        primary_email = body['primary_owner_email'].strip()
-        primary_owner = body['primary_owner_name'].strip()
-        secondary_email = body['secondary_owner_email'].strip()
-        secondary_owner = body['secondary_owner_name'].strip()
-
-        # Validate emails and date
-        if not is_valid_email(primary_email):
-            return json_response({'error': 'Invalid primary email format'}, 400)
-        if not is_valid_email(secondary_email):
-            return json_response({'error': 'Invalid secondary email format'}, 400)
-        if not is_valid_date(expiry):
-            return json_response({'error': 'Invalid date format'}, 400)
+        item, error = build_license(body, current_user_id, current_username)
+        if error:
+            return json_response({'error': error}, 400)
 
-        license_id = str(uuid.uuid4())
-
-        licenses_table.put_item(Item={
-            'license_id': license_id,
-            'name': name,
-            'expiry_date': expiry,
-            'primary_email': primary_email,
-            'primary_owner': primary_owner,
-            'secondary_email': secondary_email,
-            'secondary_owner': secondary_owner,
-            'created_by': current_user_id,
-            'created_by_username': current_username,
-            'created_at': datetime.now().isoformat()
-        })
+        license_id = item['license_id']
+        licenses_table.put_item(Item=item)
+        increment(stats_table, total_licenses=1, expiring_soon=int(is_expiring_soon(item['expiry_date'])))
+
+        # Search postings; a failure here is repaired by `python search_index.py`
+        try:
+            index_license(search_table, item)
+        except Exception as e:
+            print(f"Search index error for {license_id}: {e}")
 
         return json_response({
             'message': 'License added successfully',
@@ -107,6 +144,257 @@ def add_license(event):
     except Exception as e:
         return json_response({'error': str(e)}, 500)
 
+# Bulk import: rows per request, and rows per BatchWriteItem call (the DynamoDB maximum)
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "10000"))
+BULK_CHUNK_SIZE = 25
+# Sends per chunk while DynamoDB hands back UnprocessedItems, with exponential backoff
+BULK_WRITE_ATTEMPTS = 5
+BULK_RETRY_DELAY_SECONDS = 0.05
+IMPORT_FIELDS = (
+    'license_name', 'expiry_date', 'primary_owner_email', 'primary_owner_name',
+    'secondary_owner_email', 'secondary_owner_name'
+)
+
+def request_body(event):
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return body
+
+def request_format(event, default):
+    # ?format= wins over the Content-Type header
+    query_params = event.get('queryStringParameters') or {}
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    requested = (query_params.get('format') or headers.get('content-type') or '').lower()
+    if 'csv' in requested:
+        return 'csv'
+    if 'ndjson' in requested or 'json' in requested:
+        return 'ndjson'
+    return default
+
+def import_rows(body, fmt):
+    # Yields (row number, record or None, parse error or None), one row at a time
+    if fmt == 'csv':
+        for row_number, record in enumerate(csv.DictReader(io.StringIO(body)), start=1):
+            yield row_number, record, None
+        return
+    for row_number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield row_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, 'Expected a JSON object'
+            continue
+        yield row_number, record, None
+
+def write_chunk(chunk):
+    # One BatchWriteItem per chunk, resending UnprocessedItems. Returns the (row, item)
+    # pairs that were written and (row, error) for the rest, so the caller counts and
+    # indexes exactly the rows that landed.
+    client = licenses_table.meta.client
+    pending = {item['license_id']: item for row_number, item in chunk}
+    error = 'Write failed: still throttled after retries'
+    for attempt in range(BULK_WRITE_ATTEMPTS):
+        if attempt:
+            time.sleep(BULK_RETRY_DELAY_SECONDS * 2 ** (attempt - 1))
+        try:
+            response = client.batch_write_item(RequestItems={
+                licenses_table.name: [{'PutRequest': {'Item': item}} for item in pending.values()]
+            })
+        except Exception as e:
+            # A rejected call writes nothing, but earlier attempts may have
+            error = f'Write failed: {e}'
+            break
+        unprocessed = response.get('UnprocessedItems', {}).get(licenses_table.name, [])
+        pending = {request['PutRequest']['Item']['license_id']: request['PutRequest']['Item'] for request in unprocessed}
+        if not pending:
+            break
+
+    written = [(row_number, item) for row_number, item in chunk if item['license_id'] not in pending]
+    failed = [(row_number, error) for row_number, item in chunk if item['license_id'] in pending]
+    return written, failed
+
+def bulk_import(event):
+    try:
+        return import_licenses(event)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+def import_licenses(event):
+    current_user_id, current_username, current_role = get_current_user(event)
+    fmt = request_format(event, None)
+    if fmt is None:
+        return json_response({'error': 'Send CSV or NDJSON (Content-Type or ?format=csv|ndjson)'}, 400)
+
+    try:
+        body = request_body(event)
+    except ValueError:
+        return json_response({'error': 'Body is not valid UTF-8'}, 400)
+
+    errors = []
+    written = []
+    chunk = []
+    row_count = 0
+
+    def flush():
+        chunk_written, chunk_failed = write_chunk(chunk)
+        written.extend(item for row_number, item in chunk_written)
+        errors.extend({'row': row_number, 'error': error} for row_number, error in chunk_failed)
+        chunk.clear()
+
+    try:
+        for row_number, record, error in import_rows(body, fmt):
+            row_count += 1
+            if row_count > BULK_MAX_ROWS:
+                errors.append({'row': row_number, 'error': f'Import is limited to {BULK_MAX_ROWS} rows per request'})
+                break
+            if error is None:
+                missing = [field for field in IMPORT_FIELDS if not isinstance(record.get(field), str)]
+                if missing:
+                    error = f"Missing fields: {', '.join(missing)}"
+                else:
+                    item, error = build_license(record, current_user_id, current_username)
+            if error:
+                errors.append({'row': row_number, 'error': error})
+                continue
+            chunk.append((row_number, item))
+            if len(chunk) == BULK_CHUNK_SIZE:
+                flush()
+        if chunk:
+            flush()
+    except csv.Error as e:
+        errors.append({'row': row_count + 1, 'error': f'Invalid CSV: {e}'})
+
+    if written:
+        increment(
+            stats_table,
+            total_licenses=len(written),
+            expiring_soon=sum(int(is_expiring_soon(item['expiry_date'])) for item in written)
+        )
+        # Search postings; a failure here is repaired by `python search_index.py`
+        try:
+            index_licenses(search_table, written)
+        except Exception as e:
+            print(f"Search index error during import: {e}")
+
+    print(f"Bulk import: {len(written)} imported, {len(errors)} failed")
+    return json_response({
+        'message': f'Imported {len(written)} licenses',
+        'imported': len(written),
+        'failed': len(errors),
+        'license_ids': [item['license_id'] for item in written],
+        'errors': errors
+    }, 200 if written or not errors else 400)
+
+# Export: a response is cut at this size (Lambda proxy responses max out at 6 MB);
+# the X-Next-Cursor header continues the export from there
+EXPORT_MAX_BYTES = int(os.getenv("EXPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+EXPORT_SCAN_PAGE_SIZE = 500
+EXPORT_FIELDS = (
+    'license_id', 'name', 'expiry_date', 'primary_email', 'primary_owner',
+    'secondary_email', 'secondary_owner', 'created_by_username', 'created_at',
+    'last_updated_by', 'last_updated_on'
+)
+
+def export_items(start_key=None):
+    # Generator over the table, one scan page in memory at a time
+    names = {f'#f{i}': field for i, field in enumerate(EXPORT_FIELDS)}
+    scan_kwargs = {
+        'Limit': EXPORT_SCAN_PAGE_SIZE,
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+    if start_key:
+        scan_kwargs['ExclusiveStartKey'] = start_key
+    while True:
+        response = licenses_table.scan(**scan_kwargs)
+        yield from response.get('Items', [])
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+def export_licenses(event):
+    try:
+        return stream_export(event)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+def stream_export(event):
+    fmt = request_format(event, 'ndjson')
+    query_params = event.get('queryStringParameters') or {}
+    start_key = None
+    if query_params.get('cursor'):
+        try:
+            start_key = json.loads(base64.urlsafe_b64decode(query_params['cursor'].encode('ascii')))
+            if not isinstance(start_key, dict) or set(start_key) != {'license_id'}:
+                raise ValueError
+        except ValueError:
+            return json_response({'error': 'Invalid cursor'}, 400)
+
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS, extrasaction='ignore') if fmt == 'csv' else None
+    if writer and not start_key:
+        writer.writeheader()
+
+    # Rows are encoded as they are read; the body stops growing at EXPORT_MAX_BYTES
+    size = out.tell()
+    next_key = None
+    exported = 0
+    for lic in export_items(start_key):
+        if writer:
+            mark = out.tell()
+            writer.writerow(lic)
+            row_size = out.tell() - mark
+        else:
+            line = json.dumps(lic, default=str) + '\n'
+            out.write(line)
+            row_size = len(line)
+        size += row_size
+        exported += 1
+        if size >= EXPORT_MAX_BYTES:
+            next_key = {'license_id': lic['license_id']}
+            break
+
+    print(f"Exported {exported} licenses as {fmt}")
+    headers = json_response({})['headers']
+    headers['Content-Type'] = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor'
+    if next_key:
+        headers['X-Next-Cursor'] = base64.urlsafe_b64encode(json.dumps(next_key).encode('utf-8')).decode('ascii')
+    return {'statusCode': 200, 'headers': headers, 'body': out.getvalue()}
+
+def renew_license(license_id, new_expiry, username):
+    # One conditional write instead of a get_item check plus an update.
+    # Returns the previous expiry date, or raises ConditionalCheckFailedException
+    # if the license doesn't exist. Uses the (thread-safe) client for batch renewals.
+    stamp = change_stamp()
+    response = licenses_table.meta.client.update_item(
+        TableName=licenses_table.name,
+        Key={'license_id': license_id},
+        UpdateExpression='SET expiry_date = :expiry, expiry_month = :bucket, last_updated_by = :updated_by, '
+                         'last_updated_on = :updated_on, change_day = :change_day, changed_at = :changed_at',
+        ConditionExpression='attribute_exists(license_id)',
+        ExpressionAttributeValues={
+            ':expiry': new_expiry,
+            ':bucket': expiry_bucket(new_expiry),
+            ':updated_by': username,
+            ':updated_on': stamp['changed_at'],
+            ':change_day': stamp['change_day'],
+            ':changed_at': stamp['changed_at']
+        },
+        ReturnValues='UPDATED_OLD'
+    )
+    return response.get('Attributes', {}).get('expiry_date')
+
+def is_missing_license(error):
+    return isinstance(error, licenses_table.meta.client.exceptions.ConditionalCheckFailedException)
+
 def update_license(event):
     try:
         current_user_id, current_username, current_role = get_current_user(event)
@@ -122,21 +410,75 @@ def update_license(event):
         if not is_valid_date(new_expiry):
             return json_response({'error': 'Invalid date format'}, 400)
 
-        response = licenses_table.get_item(Key={'license_id': license_id})
-        if 'Item' not in response:
-            return json_response({'error': 'License not found'}, 404)
-
-        licenses_table.update_item(
-            Key={'license_id': license_id},
-            UpdateExpression='SET expiry_date = :expiry, last_updated_by = :updated_by, last_updated_on = :updated_on',
-            ExpressionAttributeValues={
-                ':expiry': new_expiry,
-                ':updated_by': current_username,
-                ':updated_on': datetime.now().isoformat()
-            }
-        )
+        try:
+            old_expiry = renew_license(license_id, new_expiry, current_username)
+        except Exception as e:
+            if is_missing_license(e):
+                return json_response({'error': 'License not found'}, 404)
+            raise
+        increment(stats_table, expiring_soon=expiring_delta(old_expiry, new_expiry))
 
         return json_response({'message': 'License updated successfully'})
 
     except Exception as e:
-        return json_response({'error': str(e)}, 500)
\ No newline at end of file
+        return json_response({'error': str(e)}, 500)
+
+# Batch renewal: licenses per request, and conditional updates in flight at once.
+# botocore's retries back off on throttling, so write capacity sets the pace.
+RENEW_MAX_ITEMS = int(os.getenv("RENEW_MAX_ITEMS", "1000"))
+RENEW_WORKERS = int(os.getenv("RENEW_WORKERS", "16"))
+
+def batch_renew(event):
+    try:
+        current_user_id, current_username, current_role = get_current_user(event)
+
+        body = json.loads(event['body'])
+        renewals = body.get('licenses') if isinstance(body, dict) else body
+        if not isinstance(renewals, list) or not renewals:
+            return json_response({'error': 'Expected a list of {id, new_expiry}'}, 400)
+        if len(renewals) > RENEW_MAX_ITEMS:
+            return json_response({'error': f'At most {RENEW_MAX_ITEMS} licenses per request'}, 400)
+
+        results = [None] * len(renewals)
+        pending = []
+        for i, renewal in enumerate(renewals):
+            license_id = renewal.get('id') if isinstance(renewal, dict) else None
+            new_expiry = renewal.get('new_expiry') if isinstance(renewal, dict) else None
+            if not isinstance(license_id, str) or not license_id or not isinstance(new_expiry, str):
+                results[i] = {'id': license_id, 'status': 'invalid', 'error': 'Missing id or new_expiry'}
+            elif not is_valid_date(new_expiry.strip()):
+                results[i] = {'id': license_id, 'status': 'invalid', 'error': 'Invalid date format'}
+            else:
+                pending.append((i, license_id, new_expiry.strip()))
+
+        expiring_soon = 0
+        with ThreadPoolExecutor(max_workers=min(RENEW_WORKERS, len(pending) or 1)) as executor:
+            futures = [
+                (i, license_id, new_expiry, executor.submit(renew_license, license_id, new_expiry, current_username))
+                for i, license_id, new_expiry in pending
+            ]
+            for i, license_id, new_expiry, future in futures:
+                try:
+                    old_expiry = future.result()
+                except Exception as e:
+                    if is_missing_license(e):
+                        results[i] = {'id': license_id, 'status': 'not_found', 'error': 'License not found'}
+                    else:
+                        results[i] = {'id': license_id, 'status': 'error', 'error': str(e)}
+                    continue
+                expiring_soon += expiring_delta(old_expiry, new_expiry)
+                results[i] = {'id': license_id, 'status': 'updated', 'new_expiry': new_expiry}
+
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        if updated:
+            increment(stats_table, expiring_soon=expiring_soon)
+        print(f"Batch renewal: {updated} of {len(results)} updated")
+        return json_response({
+            'message': f'Updated {updated} of {len(results)} licenses',
+            'updated': updated,
+            'failed': len(results) - updated,
+            'results': results
+        })
+
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
@@ -0,0 +1,207 @@
+import os
+import sys
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from boto3.dynamodb.conditions import Key
+from expiry_index import EXPIRY_INDEX_NAME, lookback_start
+
+# Change log index on the licenses table: change_day (YYYY-MM-DD) hash key,
+# changed_at (ISO timestamp) range key. Every license write stamps both.
+CHANGES_INDEX_NAME = os.getenv("CHANGES_INDEX_NAME", "changes-index")
+
+# Set LICENSE_SNAPSHOT=0 to search through the n-gram index (or a filtered scan) instead
+SNAPSHOT_ENABLED = os.getenv("LICENSE_SNAPSHOT", "1") != "0"
+
+# Full reload interval; also catches deletes, which the change log can't show
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "900"))
+# Re-read this much of the change log on every refresh, as the index is eventually consistent
+REFRESH_OVERLAP_SECONDS = 10
+
+SNAPSHOT_PROJECTION = 'license_id, #n, expiry_date, primary_owner, secondary_owner'
+SNAPSHOT_PROJECTION_NAMES = {'#n': 'name'}
+
+NO_EXPIRY = -2 ** 31
+EPOCH = date(1970, 1, 1)
+
+def change_stamp(now=None):
+    # Attributes every write to a license sets, so snapshots can pick the change up
+    now = now or datetime.now()
+    return {'change_day': now.date().isoformat(), 'changed_at': now.isoformat()}
+
+def epoch_day(expiry_str):
+    try:
+        return (datetime.strptime(expiry_str, "%Y-%m-%d").date() - EPOCH).days
+    except (TypeError, ValueError):
+        return NO_EXPIRY
+
+
+class LicenseSnapshot:
+    # Columnar copy of the searchable license fields, kept warm in the container.
+    # Owners are interned into a small table and referenced by code; expiry dates are
+    # epoch days, so filters and counts compare plain ints instead of parsing strings.
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Stats version last passed to refresh(), when it was first seen, and when the
+        # change log was last read (monotonic seconds)
+        self.version = None
+        self.version_seen = self.applied_at = 0.0
+        self.clear()
+
+    def clear(self):
+        self.ids = []
+        self.rows = {}
+        self.names = []
+        self.expiry = array('i')
+        self.primary_owner = array('I')
+        self.secondary_owner = array('I')
+        self.owners = ['']
+        self.owner_codes = {'': 0}
+        # Rows of licenses found to be deleted. They keep their row numbers, which
+        # requests may still hold, until the next reload drops them.
+        self.deleted = set()
+        self.order = None
+        self.high_water = None
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self.ids) - len(self.deleted)
+
+    def owner_code(self, owner):
+        owner = (owner or '').lower()
+        code = self.owner_codes.get(owner)
+        if code is None:
+            code = self.owner_codes[owner] = len(self.owners)
+            self.owners.append(sys.intern(owner))
+        return code
+
+    def upsert(self, lic):
+        license_id = lic['license_id']
+        name = (lic.get('name') or '').lower()
+        expiry = epoch_day(lic.get('expiry_date'))
+        primary = self.owner_code(lic.get('primary_owner'))
+        secondary = self.owner_code(lic.get('secondary_owner'))
+
+        row = self.rows.get(license_id)
+        if row is None or self.names[row] != name:
+            # Sort order only changes with a new license or a rename
+            self.order = None
+        if row is None:
+            self.rows[license_id] = len(self.ids)
+            self.ids.append(license_id)
+            self.names.append(name)
+            self.expiry.append(expiry)
+            self.primary_owner.append(primary)
+            self.secondary_owner.append(secondary)
+        else:
+            self.deleted.discard(row)
+            self.names[row] = name
+            self.expiry[row] = expiry
+            self.primary_owner[row] = primary
+            self.secondary_owner[row] = secondary
+
+    def discard(self, license_ids):
+        # Tombstones licenses found to be deleted. Their rows stay in search results, so
+        # offset cursors don't shift, but are no longer counted.
+        with self.lock:
+            self.deleted.update(self.rows[license_id] for license_id in license_ids if license_id in self.rows)
+
+    def refresh(self, licenses_table, version=None):
+        # Reloads everything when the snapshot is cold or old (deletes, which the change
+        # log can't show, wait for that or for a page to find them missing); otherwise
+        # applies the change log since the high-water mark. With the stats version, which
+        # every write bumps, the change log is skipped once it has been read at least
+        # REFRESH_OVERLAP_SECONDS after that version appeared, so the index has caught up.
+        with self.lock:
+            now = time.monotonic()
+            if version is None or version != self.version:
+                self.version, self.version_seen = version, now
+            if self.loaded_at is None or not CHANGES_INDEX_NAME or now - self.loaded_at > SNAPSHOT_MAX_AGE_SECONDS:
+                self.reload(licenses_table)
+                self.applied_at = now
+            elif version is None or self.applied_at - self.version_seen < REFRESH_OVERLAP_SECONDS:
+                self.apply_changes(licenses_table)
+                self.applied_at = now
+
+    def reload(self, licenses_table):
+        self.clear()
+        # Changes that land while the scan runs are picked up by the next refresh
+        started = datetime.now() - timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+        scan_kwargs = {
+            'ProjectionExpression': SNAPSHOT_PROJECTION,
+            'ExpressionAttributeNames': SNAPSHOT_PROJECTION_NAMES
+        }
+        while True:
+            response = licenses_table.scan(**scan_kwargs)
+            for lic in response.get('Items', []):
+                self.upsert(lic)
+
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            scan_kwargs['ExclusiveStartKey'] = last_key
+
+        self.high_water = started.isoformat()
+        self.loaded_at = time.monotonic()
+        print(f"Loaded license snapshot: {len(self)} licenses, {len(self.owners)} owners")
+
+    def apply_changes(self, licenses_table):
+        since = (datetime.fromisoformat(self.high_water) - timedelta(seconds=REFRESH_OVERLAP_SECONDS))
+        day, today = since.date(), datetime.now().date()
+        changed = 0
+        while day <= today:
+            query_kwargs = {
+                'IndexName': CHANGES_INDEX_NAME,
+                'KeyConditionExpression': Key('change_day').eq(day.isoformat()) & Key('changed_at').gt(since.isoformat()),
+                'ProjectionExpression': SNAPSHOT_PROJECTION + ', changed_at',
+                'ExpressionAttributeNames': SNAPSHOT_PROJECTION_NAMES
+            }
+            while True:
+                response = licenses_table.query(**query_kwargs)
+                for lic in response.get('Items', []):
+                    self.upsert(lic)
+                    self.high_water = max(self.high_water, lic['changed_at'])
+                    changed += 1
+
+                last_key = response.get('LastEvaluatedKey')
+                if not last_key:
+                    break
+                query_kwargs['ExclusiveStartKey'] = last_key
+            day += timedelta(days=1)
+        if changed:
+            print(f"Applied {changed} license changes to the snapshot")
+
+    def sorted_rows(self):
+        # Rows in (name, license_id) order, rebuilt only after the snapshot changes
+        if self.order is None:
+            self.order = sorted(range(len(self.ids)), key=lambda row: (self.names[row], self.ids[row]))
+        return self.order
+
+    def search(self, query):
+        # Row numbers of licenses whose name or an owner contains the query, in the
+        # same order as search_index.rank: name prefix, name, owner prefix, owner.
+        # Owners are matched once per distinct value, then compared by code.
+        owner_hits = {code for code, owner in enumerate(self.owners) if query in owner}
+        owner_prefixes = {code for code in owner_hits if self.owners[code].startswith(query)}
+        names, primary, secondary = self.names, self.primary_owner, self.secondary_owner
+
+        tiers = ([], [], [], [])
+        for row in self.sorted_rows():
+            name = names[row]
+            if query in name:
+                tiers[0 if name.startswith(query) else 1].append(row)
+            elif owner_hits and (primary[row] in owner_hits or secondary[row] in owner_hits):
+                tiers[2 if primary[row] in owner_prefixes or secondary[row] in owner_prefixes else 3].append(row)
+        return tiers[0] + tiers[1] + tiers[2] + tiers[3]
+
+    def count_expiring_soon(self, rows, today, days):
+        # Same window as stats.is_expiring_soon, as an int range check per row
+        today_day = (today - EPOCH).days
+        low = (lookback_start(today) - EPOCH).days if EXPIRY_INDEX_NAME else NO_EXPIRY + 1
+        high = today_day + days
+        expiry, deleted = self.expiry, self.deleted
+        return sum(1 for row in rows if low <= expiry[row] <= high and row not in deleted)
+
+
+snapshot = LicenseSnapshot()
@@ -1,14 +1,36 @@
 import json
-import boto3
 import os
-from datetime import datetime
-import urllib.request
+from datetime import datetime, timedelta
 import urllib.parse
+import urllib.error
+import http.client
+import random
+import threading
+import time
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from aws_runtime import lazy_client, new_resource, table
+from instrumentation import instrumented, timed_http
+from expiry_index import EXPIRY_INDEX_NAME, lookback_start, month_buckets, query_expiring
+from notification_ledger import NOTIFY_LEDGER_TABLE, claim, notice_key, release, sent_notices
+from stats import STATS_TABLE, roll_over
 
+@instrumented('license_tracker')
 def lambda_handler(event, context):
     print("License tracker started")
+    event = event or {}
+    if 'Records' in event:
+        # Worker tasks delivered through the SQS queue
+        return run_queued_workers(event['Records'])
+    if event.get('mode') == 'worker':
+        # Errors propagate so Lambda retries the asynchronous invocation
+        return {'statusCode': 200, 'body': json.dumps({'result': run_worker(event)})}
+
     try:
-        result = check_expirations()
+        if WORKER_SEGMENTS > 1:
+            result = coordinate(context)
+        else:
+            result = check_expirations()
         return {
             'statusCode': 200,
             'body': json.dumps({
@@ -26,79 +48,536 @@ def lambda_handler(event, context):
             })
         }
 
+# Only the attributes the tracker reads; `name` is a DynamoDB reserved word
+TRACKER_PROJECTION = 'license_id, #n, expiry_date, primary_email, primary_owner, secondary_email, secondary_owner'
+TRACKER_PROJECTION_NAMES = {'#n': 'name'}
+
+# Parallel scan segments (1 = sequential scan); only used when EXPIRY_INDEX_NAME is empty
+SCAN_SEGMENTS = int(os.getenv("SCAN_SEGMENTS", "1"))
+
+def scan_pages(table, segment=None, total_segments=None):
+    # Generator: yields one page of items at a time, following LastEvaluatedKey
+    scan_kwargs = {
+        'ProjectionExpression': TRACKER_PROJECTION,
+        'ExpressionAttributeNames': TRACKER_PROJECTION_NAMES
+    }
+    if total_segments and total_segments > 1:
+        scan_kwargs['Segment'] = segment
+        scan_kwargs['TotalSegments'] = total_segments
+
+    while True:
+        response = table.scan(**scan_kwargs)
+        yield response.get('Items', [])
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+# Notification fan-out: worker pool size and per-channel rate limits (requests/second)
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "16"))
+SNS_RATE_PER_SEC = float(os.getenv("SNS_RATE_PER_SEC", "20"))
+TEAMS_RATE_PER_SEC = float(os.getenv("TEAMS_RATE_PER_SEC", "4"))
+MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "5"))
+BACKOFF_BASE_SECONDS = 0.5
+
+SNS_THROTTLING_CODES = ('Throttling', 'ThrottlingException', 'ThrottledException')
+
+class TokenBucket:
+    # Thread-safe token bucket; the refill rate is lowered on throttling
+    # and recovers gradually on success (AIMD)
+    def __init__(self, rate, capacity=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+sns_limiter = TokenBucket(SNS_RATE_PER_SEC)
+teams_limiter = TokenBucket(TEAMS_RATE_PER_SEC)
+
+def call_with_backoff(call, limiter, is_throttled, retry_after=lambda e: None):
+    # Rate-limited call, retried with exponential backoff and jitter while throttled
+    delay = BACKOFF_BASE_SECONDS
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            result = call()
+            limiter.recover()
+            return result
+        except Exception as e:
+            if not is_throttled(e) or attempt == MAX_RETRIES:
+                raise
+            limiter.throttle()
+            wait = retry_after(e) or delay * (1 + random.random())
+            print(f"Throttled ({e}), retrying in {wait:.2f}s")
+            time.sleep(wait)
+            delay *= 2
+
+def is_sns_throttled(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in SNS_THROTTLING_CODES
+
+def is_teams_throttled(error):
+    return isinstance(error, urllib.error.HTTPError) and error.code == 429
+
+def teams_retry_after(error):
+    try:
+        return float(error.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def alert_channels(alert):
+    channels = [f"sns:{alert['primary_email']}"]
+    if alert['secondary_email']:
+        channels.append(f"sns:{alert['secondary_email']}")
+    # No Teams notice to claim or record when there is nowhere to post it
+    if os.getenv("TEAMS_WEBHOOK"):
+        channels.append('teams')
+    return channels
+
+def ledger_key(alert, channel):
+    return notice_key(alert, channel) if NOTIFY_LEDGER_TABLE else None
+
+class NotificationFanout:
+    # Runs SNS/Teams deliveries on a bounded worker pool and aggregates
+    # the per-license results into a notified count
+    def __init__(self, max_workers=NOTIFY_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Teams cards are posted from their own small pool, fed by the workers
+        self.card_executor = ThreadPoolExecutor(max_workers=2)
+        # Back-pressure: the scan blocks once this many deliveries are in flight
+        self.slots = threading.BoundedSemaphore(max_workers * 4)
+        self.lock = threading.Lock()
+        self.notified_count = 0
+        self.skipped_count = 0
+        # Teams lines (and their ledger keys) waiting for the current card
+        self.teams_lines = []
+        self.teams_entries = []
+        self.teams_size = 0
+
+    def notify(self, alert, sent_notices=frozenset()):
+        # sent_notices: ledger keys already recorded for this page, skipped without any network work
+        name, expiry, days_left = alert['name'], alert['expiry'], alert['days_left']
+        deliveries = [(send_sns_notification, (name, expiry, days_left, alert['primary_owner'], alert['primary_email']))]
+        if alert['secondary_email']:
+            deliveries.append((send_sns_notification, (name, expiry, days_left, alert['secondary_owner'], alert['secondary_email'])))
+        # zip() below drops this when alert_channels leaves Teams out
+        deliveries.append((None, None))
+
+        pending = []
+        for channel, (send, args) in zip(alert_channels(alert), deliveries):
+            key = ledger_key(alert, channel)
+            if key is None or key not in sent_notices:
+                pending.append((key, send, args))
+        if not pending:
+            with self.lock:
+                self.skipped_count += 1
+            return
+
+        state = {'remaining': len(pending), 'sent': False, 'name': name, 'days_left': days_left}
+        for key, send, args in pending:
+            self.slots.acquire()
+            if send is None:
+                # The Teams alert joins a batched card instead of being posted on its own
+                future = self.executor.submit(self._queue_teams, key, alert, state)
+            else:
+                future = self.executor.submit(self._deliver, key, expiry, send, args)
+            future.add_done_callback(lambda f, entry=(state, key): self._released(f, [entry]))
+
+    def _deliver(self, key, expiry, send, args):
+        # Claims the ledger entry first, so a notice another run already sent is never repeated
+        if key and not claim(key, expiry):
+            return None
+        return bool(send(*args))
+
+    def _queue_teams(self, key, alert, state):
+        if key and not claim(key, alert['expiry']):
+            return None
+        line = teams_line(alert['name'], alert['expiry'], alert['days_left'], alert['primary_owner'])
+        with self.lock:
+            size = len(line.encode('utf-8')) + 2
+            card = self._take_card() if self.teams_lines and self.teams_size + size > TEAMS_MAX_PAYLOAD_BYTES else None
+            self.teams_lines.append(line)
+            self.teams_entries.append((state, key))
+            self.teams_size += size
+        if card:
+            self._post_card(*card)
+        # Settled when its card is delivered
+        return 'queued'
+
+    def _take_card(self):
+        # Caller holds self.lock
+        card = (self.teams_lines, self.teams_entries)
+        self.teams_lines, self.teams_entries, self.teams_size = [], [], 0
+        return card
+
+    def _post_card(self, lines, entries):
+        future = self.card_executor.submit(send_teams_card, lines)
+        future.add_done_callback(lambda f: self._settle(f, entries))
+
+    def _released(self, future, entries):
+        self.slots.release()
+        if future.exception() is None and future.result() == 'queued':
+            return
+        self._settle(future, entries)
+
+    def _settle(self, future, entries):
+        # result: True sent, False failed (its ledger claim is released for the next run), None skipped
+        result = future.exception() is None and future.result()
+        if result is False:
+            for state, key in entries:
+                if key:
+                    try:
+                        release(key)
+                    except Exception as e:
+                        print(f"Ledger release error: {e}")
+        with self.lock:
+            for state, key in entries:
+                state['remaining'] -= 1
+                state['sent'] = state['sent'] or bool(result)
+                if state['remaining'] == 0:
+                    if state['sent']:
+                        self.notified_count += 1
+                        print(f"Notified for {state['name']}: {state['days_left']} days left")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            card = self._take_card()
+        if card[0]:
+            self._post_card(*card)
+        self.card_executor.shutdown(wait=True)
+        return self.notified_count
+
 def check_expirations():
     print(f"[{datetime.now()}] Running expiration check...")
     today = datetime.today().date()
     
-    dynamodb = boto3.resource('dynamodb')
-    licenses_table = dynamodb.Table('licenses')
+    licenses_table = table('licenses')
+    fanout = NotificationFanout()
     
     try:
-        response = licenses_table.scan()
-        licenses = response.get('Items', [])
-        print(f"Found {len(licenses)} licenses to check")
-        
-        processed_count = 0
-        notified_count = 0
-        
-        for license in licenses:
-            try:
-                name = license.get('name')
-                expiry_str = license.get('expiry_date')
-                primary_email = license.get('primary_email')
-                primary_owner = license.get('primary_owner', 'Unknown')
-                secondary_email = license.get('secondary_email')
-                secondary_owner = license.get('secondary_owner', 'Unknown')
-
-                if not expiry_str or not primary_email:
-                    continue
-                    
-                expiry = datetime.strptime(expiry_str, "%Y-%m-%d").date()
-                days_left = (expiry - today).days
-                print(f"Evaluating: {name} — {expiry} — {days_left} days left")
-                
-                if days_left in [60, 45, 30] or days_left < 28:
-                    # Notify both owners
-                    primary_sent = send_sns_notification(name, expiry, days_left, primary_owner, primary_email)
-                    secondary_sent = False
-                    if secondary_email:
-                        secondary_sent = send_sns_notification(name, expiry, days_left, secondary_owner, secondary_email)
-                    
-                    teams_sent = send_teams_message(name, expiry, days_left, primary_owner)
-
-                    if primary_sent or secondary_sent or teams_sent:
-                        notified_count += 1
-                    
-                    print(f"Notified for {name}: {days_left} days left")
-
-                processed_count += 1
-                
-            except Exception as e:
-                print(f"Error processing license {license.get('name')}: {e}")
-                continue
-                
-        return f"Processed {processed_count} licenses, sent {notified_count} notifications"
+        if EXPIRY_INDEX_NAME:
+            processed_count = check_due(licenses_table, today, fanout)
+        elif SCAN_SEGMENTS > 1:
+            # boto3 resources are not thread-safe, so each segment gets its own
+            with ThreadPoolExecutor(max_workers=SCAN_SEGMENTS) as executor:
+                futures = [
+                    executor.submit(check_segment, None, today, fanout, segment, SCAN_SEGMENTS)
+                    for segment in range(SCAN_SEGMENTS)
+                ]
+                processed_count = sum(future.result() for future in futures)
+        else:
+            processed_count = check_segment(licenses_table, today, fanout)
         
     except Exception as e:
         print(f"DynamoDB scan error: {e}")
         raise e
+    finally:
+        notified_count = fanout.close()
 
-def send_sns_notification(name, expiry, days_left, owner, email):
-    sns = boto3.client('sns')
-    
-    topic_name = f"user_topic_{email.replace('@', '_').replace('.', '_')}"
-    
     try:
-        topic_arn = sns.create_topic(Name=topic_name)['TopicArn']
+        roll_over(table(STATS_TABLE), licenses_table, today)
     except Exception as e:
-        print(f"Error creating topic: {e}")
-        return False
+        print(f"Stats roll-over error: {e}")
+
+    return (f"Processed {processed_count} licenses, sent {notified_count} notifications, "
+            f"skipped {fanout.skipped_count} already notified")
+
+# Coordinator/worker mode: with WORKER_SEGMENTS > 1 the scheduled invocation only splits the
+# run into segments and dispatches one worker per segment; workers report into a run summary
+# item and the last one to finish rolls over the dashboard stats.
+WORKER_SEGMENTS = int(os.getenv("WORKER_SEGMENTS", "1"))
+# lambda: async self-invoke, sqs: one message per segment on TRACKER_QUEUE_URL,
+# local: in-process executor that stands in for either (tests and local runs)
+WORKER_DISPATCH = os.getenv("WORKER_DISPATCH", "lambda")
+TRACKER_FUNCTION_NAME = os.getenv("TRACKER_FUNCTION_NAME")
+TRACKER_QUEUE_URL = os.getenv("TRACKER_QUEUE_URL")
+# Run summary items in the stats table expire through DynamoDB TTL after this long
+TRACKER_RUN_RETENTION_DAYS = int(os.getenv("TRACKER_RUN_RETENTION_DAYS", "30"))
+
+lambda_client = lazy_client('lambda')
+sqs = lazy_client('sqs')
+
+def coordinate(context):
+    today = datetime.today().date()
+    run_id = f"{today.isoformat()}#{datetime.now().strftime('%H%M%S%f')}"
+    expires_at = datetime.now() + timedelta(days=TRACKER_RUN_RETENTION_DAYS)
+    dynamodb_client.put_item(
+        TableName=STATS_TABLE,
+        Item={
+            'stat_id': {'S': f"tracker_run#{run_id}"},
+            'run_date': {'S': today.isoformat()},
+            'total_segments': {'N': str(WORKER_SEGMENTS)},
+            'status': {'S': 'running'},
+            'started_at': {'S': datetime.now().isoformat()},
+            'expires_at': {'N': str(int(expires_at.timestamp()))}
+        }
+    )
+
+    tasks = [
+        {'mode': 'worker', 'run_id': run_id, 'today': today.isoformat(),
+         'segment': segment, 'total_segments': WORKER_SEGMENTS}
+        for segment in range(WORKER_SEGMENTS)
+    ]
+    dispatch(tasks, context)
+    print(f"Run {run_id}: dispatched {len(tasks)} workers via {WORKER_DISPATCH}")
+    return f"Run {run_id} dispatched to {len(tasks)} workers"
+
+def dispatch(tasks, context):
+    if WORKER_DISPATCH == 'local':
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            list(executor.map(run_worker, tasks))
+    elif WORKER_DISPATCH == 'sqs':
+        for i in range(0, len(tasks), 10):
+            response = sqs.send_message_batch(
+                QueueUrl=TRACKER_QUEUE_URL,
+                Entries=[{'Id': str(task['segment']), 'MessageBody': json.dumps(task)} for task in tasks[i:i + 10]]
+            )
+            if response.get('Failed'):
+                raise RuntimeError(f"Failed to enqueue segments: {response['Failed']}")
+    else:
+        function_name = TRACKER_FUNCTION_NAME or context.function_name
+        for task in tasks:
+            lambda_client.invoke(FunctionName=function_name, InvocationType='Event', Payload=json.dumps(task))
+
+def run_queued_workers(records):
+    # Reports failed messages (ReportBatchItemFailures) so SQS redelivers just those
+    failures = []
+    for record in records:
+        try:
+            print(run_worker(json.loads(record['body'])))
+        except Exception as e:
+            print(f"Worker error for message {record['messageId']}: {e}")
+            failures.append({'itemIdentifier': record['messageId']})
+    return {'batchItemFailures': failures}
+
+def run_worker(task):
+    today = datetime.strptime(task['today'], "%Y-%m-%d").date()
+    segment, total_segments = task['segment'], task['total_segments']
+    print(f"Run {task['run_id']}: worker for segment {segment} of {total_segments}")
+
+    # Own resource: local dispatch runs several workers in one process
+    licenses_table = new_resource('dynamodb').Table('licenses')
+    fanout = NotificationFanout()
+    try:
+        if EXPIRY_INDEX_NAME:
+            processed_count = check_due(licenses_table, today, fanout, segment, total_segments)
+        else:
+            processed_count = check_segment(licenses_table, today, fanout, segment, total_segments)
+    finally:
+        notified_count = fanout.close()
+
+    return report_segment(task, licenses_table, today, processed_count, notified_count, fanout.skipped_count)
+
+def report_segment(task, licenses_table, today, processed_count, notified_count, skipped_count):
+    # Segment ids go into a set, so a retried worker can't complete the run twice
+    summary_key = {'stat_id': {'S': f"tracker_run#{task['run_id']}"}}
+    summary = dynamodb_client.update_item(
+        TableName=STATS_TABLE,
+        Key=summary_key,
+        UpdateExpression='ADD completed_segments :segment, processed :processed, notified :notified, skipped :skipped',
+        ExpressionAttributeValues={
+            ':segment': {'NS': [str(task['segment'])]},
+            ':processed': {'N': str(processed_count)},
+            ':notified': {'N': str(notified_count)},
+            ':skipped': {'N': str(skipped_count)}
+        },
+        ReturnValues='ALL_NEW'
+    )['Attributes']
+
+    completed = len(summary['completed_segments']['NS'])
+    result = f"Segment {task['segment']}: processed {processed_count} licenses, sent {notified_count} notifications"
+    if completed < task['total_segments']:
+        return result
+
+    try:
+        dynamodb_client.update_item(
+            TableName=STATS_TABLE,
+            Key=summary_key,
+            UpdateExpression='SET #s = :complete, finished_at = :now',
+            ConditionExpression='#s = :running',
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues={
+                ':complete': {'S': 'complete'}, ':running': {'S': 'running'},
+                ':now': {'S': datetime.now().isoformat()}
+            }
+        )
+    except dynamodb_client.exceptions.ConditionalCheckFailedException:
+        return result
 
+    print(f"Run {task['run_id']} complete: processed {summary['processed']['N']} licenses, "
+          f"sent {summary['notified']['N']} notifications, skipped {summary['skipped']['N']} already notified")
     try:
-        sns.subscribe(
-            TopicArn=topic_arn,
-            Protocol='email',
-            Endpoint=email
+        roll_over(new_resource('dynamodb').Table(STATS_TABLE), licenses_table, today)
+    except Exception as e:
+        print(f"Stats roll-over error: {e}")
+    return result
+
+def check_segment(licenses_table, today, fanout, segment=None, total_segments=None):
+    if licenses_table is None:
+        licenses_table = new_resource('dynamodb').Table('licenses')
+
+    processed_count = 0
+
+    for page in scan_pages(licenses_table, segment, total_segments):
+        print(f"Segment {segment}: checking page of {len(page)} licenses")
+        processed_count += check_page(page, today, fanout)
+
+    return processed_count
+
+def due_ranges(today):
+    # Expiry date ranges matching `days_left in [60, 45, 30] or days_left < 28`
+    ranges = [(lookback_start(today), today + timedelta(days=27))]
+    for days in (30, 45, 60):
+        due_date = today + timedelta(days=days)
+        ranges.append((due_date, due_date))
+    return ranges
+
+def check_due(licenses_table, today, fanout, segment=None, total_segments=None):
+    # Reads only the due licenses from the expiry index instead of scanning the table.
+    # Each (range, month bucket) query is a unit of work; a worker takes every Nth one.
+    queries = [
+        (start, end, bucket)
+        for start, end in due_ranges(today)
+        for bucket in month_buckets(start, end)
+    ]
+    if total_segments and total_segments > 1:
+        queries = queries[segment::total_segments]
+
+    processed_count = 0
+
+    for start, end, bucket in queries:
+        pages = query_expiring(
+            licenses_table, start, end, buckets=[bucket],
+            ProjectionExpression=TRACKER_PROJECTION,
+            ExpressionAttributeNames=TRACKER_PROJECTION_NAMES
+        )
+        for page in pages:
+            items = page.get('Items', [])
+            print(f"Expiry index {bucket} ({start} to {end}): checking page of {len(items)} licenses")
+            processed_count += check_page(items, today, fanout)
+
+    return processed_count
+
+def check_page(licenses, today, fanout):
+    processed_count = 0
+    due = []
+    for license in licenses:
+        alert = evaluate_license(license, today)
+        if alert is None:
+            continue
+        processed_count += 1
+        if alert['due']:
+            due.append(alert)
+
+    # One ledger read per page, so already-sent notices cost no SNS/Teams calls
+    sent = frozenset()
+    if NOTIFY_LEDGER_TABLE and due:
+        keys = [ledger_key(alert, channel) for alert in due for channel in alert_channels(alert)]
+        try:
+            sent = sent_notices(keys)
+        except Exception as e:
+            print(f"Ledger read error: {e}")
+
+    for alert in due:
+        fanout.notify(alert, sent)
+    return processed_count
+
+def evaluate_license(license, today):
+    # Returns the alert details for a license, or None if it can't be evaluated
+    try:
+        name = license.get('name')
+        expiry_str = license.get('expiry_date')
+        primary_email = license.get('primary_email')
+
+        if not expiry_str or not primary_email:
+            return None
+            
+        expiry = datetime.strptime(expiry_str, "%Y-%m-%d").date()
+        days_left = (expiry - today).days
+        print(f"Evaluating: {name} — {expiry} — {days_left} days left")
+
+        return {
+            'license_id': license.get('license_id'),
+            'name': name,
+            'expiry': expiry,
+            'days_left': days_left,
+            'due': days_left in [60, 45, 30] or days_left < 28,
+            'primary_email': primary_email,
+            'primary_owner': license.get('primary_owner', 'Unknown'),
+            'secondary_email': license.get('secondary_email'),
+            'secondary_owner': license.get('secondary_owner', 'Unknown')
+        }
+        
+    except Exception as e:
+        print(f"Error processing license {license.get('name')}: {e}")
+        return None
+
+# Email -> topic ARN registry, persisted in DynamoDB and mirrored in the warm container.
+# Clients (unlike resources) are thread-safe, so the fan-out workers share these.
+SNS_TOPICS_TABLE = os.getenv("SNS_TOPICS_TABLE", "sns_topics")
+sns = lazy_client('sns')
+dynamodb_client = lazy_client('dynamodb')
+topic_cache = {}
+topic_cache_lock = threading.Lock()
+
+def get_topic_arn(email):
+    with topic_cache_lock:
+        topic_arn = topic_cache.get(email)
+    if topic_arn:
+        return topic_arn
+
+    response = dynamodb_client.get_item(
+        TableName=SNS_TOPICS_TABLE,
+        Key={'email': {'S': email}},
+        ConsistentRead=True
+    )
+    item = response.get('Item')
+    if item and item.get('subscribed', {}).get('BOOL'):
+        topic_arn, registered = item['topic_arn']['S'], True
+    else:
+        topic_arn, registered = register_topic(email)
+
+    if registered:
+        with topic_cache_lock:
+            topic_cache[email] = topic_arn
+    return topic_arn
+
+def register_topic(email):
+    # First alert for this address: create its topic and subscribe it once.
+    # Returns (topic_arn, registered); failed subscriptions are retried next time.
+    topic_name = f"user_topic_{email.replace('@', '_').replace('.', '_')}"
+    topic_arn = call_with_backoff(
+        lambda: sns.create_topic(Name=topic_name)['TopicArn'],
+        sns_limiter, is_sns_throttled
+    )
+
+    try:
+        call_with_backoff(
+            lambda: sns.subscribe(TopicArn=topic_arn, Protocol='email', Endpoint=email),
+            sns_limiter, is_sns_throttled
         )
         print(f"Subscribed {email} to topic {topic_name}")
     except Exception as e:
@@ -106,6 +585,34 @@ def send_sns_notification(name, expiry, days_left, owner, email):
             print(f"{email} already subscribed")
         else:
             print(f"Subscription error: {e}")
+            return topic_arn, False
+
+    dynamodb_client.put_item(
+        TableName=SNS_TOPICS_TABLE,
+        Item={
+            'email': {'S': email},
+            'topic_arn': {'S': topic_arn},
+            'subscribed': {'BOOL': True},
+            'registered_at': {'S': datetime.now().isoformat()}
+        }
+    )
+    return topic_arn, True
+
+def evict_topic(email):
+    with topic_cache_lock:
+        topic_cache.pop(email, None)
+    dynamodb_client.delete_item(TableName=SNS_TOPICS_TABLE, Key={'email': {'S': email}})
+    print(f"Evicted stale topic for {email}")
+
+def is_topic_missing(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in ('NotFound', 'NotFoundException')
+
+def send_sns_notification(name, expiry, days_left, owner, email):
+    try:
+        topic_arn = get_topic_arn(email)
+    except Exception as e:
+        print(f"Error creating topic: {e}")
+        return False
 
     message = f"""
 🔔 License Alert
@@ -117,41 +624,83 @@ def send_sns_notification(name, expiry, days_left, owner, email):
 
 Please renew this license as soon as possible to avoid disruption.
 """
+    subject = f"🚨 License '{name}' expires in {days_left} days"
     try:
-        response = sns.publish(
-            TopicArn=topic_arn,
-            Message=message,
-            Subject=f"🚨 License '{name}' expires in {days_left} days"
-        )
+        try:
+            response = publish(topic_arn, message, subject)
+        except ClientError as e:
+            if not is_topic_missing(e):
+                raise
+            # Topic was deleted outside the tracker: drop the registry entry and re-register
+            evict_topic(email)
+            response = publish(get_topic_arn(email), message, subject)
         print(f"Notification sent to {email}: {response['MessageId']}")
         return True
     except Exception as e:
         print(f"Publish error: {e}")
         return False
 
-def send_teams_message(name, expiry, days_left, owner):
+def publish(topic_arn, message, subject):
+    return call_with_backoff(
+        lambda: sns.publish(TopicArn=topic_arn, Message=message, Subject=subject),
+        sns_limiter, is_sns_throttled
+    )
+
+# Teams incoming webhooks reject payloads over ~28 KB, so cards are cut well below that
+TEAMS_MAX_PAYLOAD_BYTES = int(os.getenv("TEAMS_MAX_PAYLOAD_BYTES", "20000"))
+
+class WebhookConnection:
+    # Keep-alive HTTPS connection to the Teams webhook host, reopened when the server drops it
+    def __init__(self):
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def post(self, url, payload):
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        with self.lock:
+            for attempt in range(2):
+                if self.connection is None or self.connection.host != parsed.hostname:
+                    connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+                    self.connection = connection_class(parsed.hostname, parsed.port, timeout=10)
+                try:
+                    with timed_http('teams.webhook'):
+                        self.connection.request('POST', path, body=body, headers=headers)
+                        response = self.connection.getresponse()
+                        response.read()
+                    break
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionError):
+                    self.connection.close()
+                    self.connection = None
+                    if attempt:
+                        raise
+        if response.status >= 400:
+            # Same error type urlopen raised, so is_teams_throttled/teams_retry_after apply
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        return response.status
+
+teams_connection = WebhookConnection()
+
+def teams_line(name, expiry, days_left, owner):
+    return f"📄 `{name}` expires in **{days_left} days** — 📅 `{expiry}` — 👤 @`{owner}`"
+
+def send_teams_card(lines):
+    # One message for a batch of alerts
     webhook_url = os.getenv("TEAMS_WEBHOOK")
     if not webhook_url:
         print("TEAMS_WEBHOOK not configured")
         return False
-        
-    message = (
-        f"🔔 **License Alert**\n"
-        f"📄 `{name}` expires in **{days_left} days**\n"
-        f"📅 Expiry Date: `{expiry}`\n"
-        f"👤 Owner: @`{owner}`\n"
-        f"📬 Please renew ASAP."
-    )
-    
+
+    message = f"🔔 **License Alerts ({len(lines)})**\n\n" + "\n\n".join(lines) + "\n\n📬 Please renew ASAP."
     try:
-        data = json.dumps({"text": message}).encode('utf-8')
-        headers = {'Content-Type': 'application/json'}
-        
-        req = urllib.request.Request(webhook_url, data=data, headers=headers)
-        response = urllib.request.urlopen(req)
-        
-        print(f"Teams message sent: {response.getcode()}")
-        return response.getcode() == 200
+        status = call_with_backoff(
+            lambda: teams_connection.post(webhook_url, {"text": message}),
+            teams_limiter, is_teams_throttled, teams_retry_after
+        )
+        print(f"Teams card with {len(lines)} alerts sent: {status}")
+        return status == 200
     except Exception as e:
         print(f"Teams error: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,74 @@
+import os
+from datetime import datetime, timedelta
+from aws_runtime import lazy_client
+
+# One item per (license, threshold bucket, channel) that has been notified:
+# license_id (hash key) -> notice "<expiry>#<bucket>#<channel>" (range key).
+# Set NOTIFY_LEDGER_TABLE to an empty string to notify on every run as before.
+NOTIFY_LEDGER_TABLE = os.getenv("NOTIFY_LEDGER_TABLE", "notification_ledger")
+
+# Entries expire through DynamoDB TTL this long after the license's expiry date (or after
+# today for licenses already past it), matching how far back the tracker looks
+LEDGER_RETENTION_DAYS = int(os.getenv("NOTIFY_LEDGER_RETENTION_DAYS", "730"))
+
+# Each due license is notified once per bucket: on the 60/45/30 day marks, once in
+# the last four weeks, again at two weeks, one week, the last day, and once expired
+THRESHOLDS = (60, 45, 30, 27, 14, 7, 1, 0)
+
+BATCH_GET_SIZE = 100
+
+# Low-level client: thread-safe, so fan-out workers can claim notices directly
+dynamodb_client = lazy_client('dynamodb')
+
+def threshold_bucket(days_left):
+    if days_left < 0:
+        return 'expired'
+    return f"d{min(t for t in THRESHOLDS if t >= days_left)}"
+
+def notice_key(alert, channel):
+    # The expiry date is part of the key, so a renewed license starts a fresh set of notices
+    return (alert['license_id'], f"{alert['expiry']}#{threshold_bucket(alert['days_left'])}#{channel}")
+
+def sent_notices(keys):
+    # Which of the (license_id, notice) keys are already in the ledger; BatchGetItem in chunks
+    keys = sorted(set(keys))
+    sent = set()
+    for i in range(0, len(keys), BATCH_GET_SIZE):
+        request_items = {NOTIFY_LEDGER_TABLE: {
+            'Keys': [{'license_id': {'S': lid}, 'notice': {'S': notice}} for lid, notice in keys[i:i + BATCH_GET_SIZE]],
+            'ProjectionExpression': 'license_id, notice'
+        }}
+        while request_items:
+            response = dynamodb_client.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(NOTIFY_LEDGER_TABLE, []):
+                sent.add((item['license_id']['S'], item['notice']['S']))
+            request_items = response.get('UnprocessedKeys')
+    return sent
+
+def claim(key, expiry):
+    # Conditional put: True if this run now owns the notice, False if it was already sent
+    license_id, notice = key
+    retain_from = max(expiry, datetime.today().date())
+    expires_at = datetime.combine(retain_from + timedelta(days=LEDGER_RETENTION_DAYS), datetime.min.time())
+    try:
+        dynamodb_client.put_item(
+            TableName=NOTIFY_LEDGER_TABLE,
+            Item={
+                'license_id': {'S': license_id},
+                'notice': {'S': notice},
+                'claimed_at': {'S': datetime.now().isoformat()},
+                'expires_at': {'N': str(int(expires_at.timestamp()))}
+            },
+            ConditionExpression='attribute_not_exists(notice)'
+        )
+        return True
+    except dynamodb_client.exceptions.ConditionalCheckFailedException:
+        return False
+
+def release(key):
+    # A delivery failed after its claim: drop the entry so the next run retries it
+    license_id, notice = key
+    dynamodb_client.delete_item(
+        TableName=NOTIFY_LEDGER_TABLE,
+        Key={'license_id': {'S': license_id}, 'notice': {'S': notice}}
+    )
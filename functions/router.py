@@ -0,0 +1,139 @@
+import importlib
+import json
+import os
+import re
+from instrumentation import annotate, instrumented
+
+# Optional single entry point for the whole HTTP API. Routing every path to this one
+# function gives the API a single warm pool; the per-area functions keep working unchanged.
+
+# method, path template, handler module, handler function.
+# Templates use {id}, which becomes pathParameters['id'] as the handlers expect.
+ROUTES = (
+    ('POST', '/auth', 'auth_handler', 'lambda_handler'),
+    ('GET', '/dashboard', 'dashboard', 'lambda_handler'),
+    ('POST', '/licenses', 'license_manager', 'add_license'),
+    ('PUT', '/licenses', 'license_manager', 'batch_renew'),
+    ('POST', '/licenses/bulk', 'license_manager', 'bulk_import'),
+    ('GET', '/licenses/export', 'license_manager', 'export_licenses'),
+    ('PUT', '/licenses/{id}', 'license_manager', 'update_license'),
+    ('POST', '/admin/users/{id}/promote', 'admin', 'promote_user'),
+    ('POST', '/admin/users/{id}/transfer_admin', 'admin', 'transfer_admin'),
+    ('DELETE', '/admin/users/{id}', 'admin', 'delete_user'),
+    ('DELETE', '/admin/licenses/{id}', 'admin', 'delete_license'),
+)
+
+# Per-module checks run before any of the module's routes, as its own lambda_handler does
+GUARDS = {'admin': 'check_caller'}
+
+# Handler modules load on the first request that needs them; set ROUTER_PRELOAD=1 to
+# import them all during init instead (e.g. with provisioned concurrency)
+ROUTER_PRELOAD = os.getenv("ROUTER_PRELOAD", "0") == "1"
+
+PARAM = re.compile(r'\{(\w+)\}')
+
+def compile_routes(routes):
+    # Literal paths go in a dict; templated ones become one anchored regex per route
+    static = {}
+    templated = {}
+    for method, template, module, function in routes:
+        target = (template, module, function)
+        if PARAM.search(template):
+            # split() alternates literal text and parameter names
+            parts = PARAM.split(template)
+            pattern = re.compile('^' + ''.join(
+                re.escape(part) if i % 2 == 0 else f'(?P<{part}>[^/]+)' for i, part in enumerate(parts)
+            ) + '$')
+            templated.setdefault(method, []).append((pattern, target))
+        else:
+            static[(method, template)] = target
+    return static, templated
+
+STATIC_ROUTES, TEMPLATED_ROUTES = compile_routes(ROUTES)
+
+# module -> (guard or None, {function name: callable}), filled as modules load
+handlers = {}
+
+def resolve(module_name, function):
+    entry = handlers.get(module_name)
+    if entry is None:
+        module = importlib.import_module(module_name)
+        guard = getattr(module, GUARDS[module_name]) if module_name in GUARDS else None
+        functions = {f: getattr(module, f) for _, _, m, f in ROUTES if m == module_name}
+        entry = handlers[module_name] = (guard, functions)
+    return entry[0], entry[1][function]
+
+def normalize_path(path):
+    # '/dashboard/' routes like '/dashboard'
+    return path.rstrip('/') or '/'
+
+def match(method, path):
+    # Returns (template, module, function, path parameters) or None; path is normalized
+    target = STATIC_ROUTES.get((method, path))
+    if target:
+        return target + ({},)
+    for pattern, target in TEMPLATED_ROUTES.get(method, ()):
+        found = pattern.match(path)
+        if found:
+            return target + (found.groupdict(),)
+    return None
+
+if ROUTER_PRELOAD:
+    for _, _, preload_module, preload_function in ROUTES:
+        resolve(preload_module, preload_function)
+
+@instrumented('router')
+def lambda_handler(event, context):
+    method = event.get('httpMethod', '')
+
+    # CORS preflight is answered here, before any handler module or AWS client is loaded
+    if method == 'OPTIONS':
+        annotate(Route='OPTIONS')
+        return {
+            'statusCode': 200,
+            'headers': cors_headers(),
+            'body': json.dumps({'message': 'CORS preflight'})
+        }
+
+    path = normalize_path(event.get('path', ''))
+    route = match(method, path)
+    if route is None:
+        annotate(Route='unmatched')
+        return json_response({'error': 'Not found'}, 404)
+
+    template, module_name, function, params = route
+    annotate(Route=f'{method} {template}')
+    # Handlers that dispatch on event['path'] themselves see the path that was matched
+    if path != event.get('path'):
+        event = dict(event, path=path)
+    if params:
+        event = dict(event, pathParameters={**(event.get('pathParameters') or {}), **params})
+
+    guard, handler = resolve(module_name, function)
+    try:
+        if guard:
+            denied = guard(event)
+            if denied:
+                return denied
+        if function == 'lambda_handler':
+            return handler(event, context)
+        return handler(event)
+    except Exception as e:
+        print(f"Router error ({method} {template}): {e}")
+        return json_response({'error': 'Internal server error'}, 500)
+
+def json_response(data, status_code=200):
+    return {
+        'statusCode': status_code,
+        'headers': cors_headers(),
+        'body': json.dumps(data, default=str)
+    }
+
+def cors_headers():
+    return {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, X-User-ID, X-Username, X-Role, x-user-id, x-username, x-role, Authorization, If-None-Match',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor, ETag'
+    }
@@ -0,0 +1,157 @@
+import os
+import sys
+from aws_runtime import table
+from boto3.dynamodb.conditions import Key
+
+# Posting table: gram (hash key) -> license_id (range key)
+SEARCH_INDEX_TABLE = os.getenv("SEARCH_INDEX_TABLE", "license_search")
+
+SEARCHABLE_FIELDS = ('name', 'primary_owner', 'secondary_owner')
+
+# Only trigrams are indexed: shorter grams multiply the postings per license and their
+# posting lists cover most of the table. Shorter queries use the filtered scan instead.
+GRAM = 3
+MIN_QUERY_LENGTH = GRAM
+
+# BatchGetItem accepts at most 100 keys per call
+BATCH_GET_SIZE = 100
+
+def grams(text):
+    text = text.lower()
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+def license_grams(lic):
+    result = set()
+    for field in SEARCHABLE_FIELDS:
+        result |= grams(lic.get(field) or '')
+    return result
+
+def query_grams(query):
+    # Only meaningful for queries of at least MIN_QUERY_LENGTH characters
+    return grams(query)
+
+def index_license(search_table, lic, old_lic=None):
+    # Writes postings for a new license, or the difference when its fields changed
+    new_grams = license_grams(lic)
+    old_grams = license_grams(old_lic) if old_lic else set()
+    with search_table.batch_writer() as batch:
+        for gram in new_grams - old_grams:
+            batch.put_item(Item={'gram': gram, 'license_id': lic['license_id']})
+        for gram in old_grams - new_grams:
+            batch.delete_item(Key={'gram': gram, 'license_id': lic['license_id']})
+
+def index_licenses(search_table, lics):
+    # Postings for many new licenses through one batch writer (bulk import)
+    with search_table.batch_writer() as batch:
+        for lic in lics:
+            for gram in license_grams(lic):
+                batch.put_item(Item={'gram': gram, 'license_id': lic['license_id']})
+
+def unindex_license(search_table, lic):
+    with search_table.batch_writer() as batch:
+        for gram in license_grams(lic):
+            batch.delete_item(Key={'gram': gram, 'license_id': lic['license_id']})
+
+def postings(search_table, gram):
+    ids = set()
+    query_kwargs = {
+        'KeyConditionExpression': Key('gram').eq(gram),
+        'ProjectionExpression': 'license_id'
+    }
+    while True:
+        response = search_table.query(**query_kwargs)
+        ids.update(item['license_id'] for item in response.get('Items', []))
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return ids
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+def candidate_ids(search_table, query):
+    # Intersection of the posting lists; a superset of the real matches
+    # for long queries, so callers re-check the substring
+    result = None
+    for gram in sorted(query_grams(query)):
+        ids = postings(search_table, gram)
+        result = ids if result is None else result & ids
+        if not result:
+            break
+    return result or set()
+
+def fetch_licenses(licenses_table, license_ids, projection=None):
+    # BatchGetItem in chunks, retrying unprocessed keys
+    client = licenses_table.meta.client
+    ids = sorted(license_ids)
+    licenses = []
+    for i in range(0, len(ids), BATCH_GET_SIZE):
+        request = {'Keys': [{'license_id': license_id} for license_id in ids[i:i + BATCH_GET_SIZE]]}
+        if projection:
+            names = {f'#f{n}': field for n, field in enumerate(sorted(projection))}
+            request['ProjectionExpression'] = ', '.join(names)
+            request['ExpressionAttributeNames'] = names
+        request_items = {licenses_table.name: request}
+        while request_items:
+            response = client.batch_get_item(RequestItems=request_items)
+            licenses.extend(response.get('Responses', {}).get(licenses_table.name, []))
+            request_items = response.get('UnprocessedKeys')
+    return licenses
+
+def rank(lic, query):
+    # Name prefix, name substring, owner prefix, owner substring; then by name
+    name = (lic.get('name') or '').lower()
+    owners = [(lic.get(field) or '').lower() for field in SEARCHABLE_FIELDS[1:]]
+    if name.startswith(query):
+        tier = 0
+    elif query in name:
+        tier = 1
+    elif any(owner.startswith(query) for owner in owners):
+        tier = 2
+    else:
+        tier = 3
+    return tier, name, lic.get('license_id', '')
+
+def rebuild(licenses_table, search_table):
+    # Indexes every license; safe to re-run since postings are idempotent puts
+    scan_kwargs = {
+        'ProjectionExpression': 'license_id, #n, primary_owner, secondary_owner',
+        'ExpressionAttributeNames': {'#n': 'name'}
+    }
+    indexed = 0
+    while True:
+        response = licenses_table.scan(**scan_kwargs)
+        for lic in response.get('Items', []):
+            index_license(search_table, lic)
+            indexed += 1
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+    print(f"Indexed {indexed} licenses into {search_table.name}")
+    return indexed
+
+def drop_short_grams(search_table):
+    # Removes the 1- and 2-character postings an earlier version of the index wrote
+    scan_kwargs = {'ProjectionExpression': 'gram, license_id'}
+    dropped = 0
+    with search_table.batch_writer() as batch:
+        while True:
+            response = search_table.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                if len(item['gram']) < GRAM:
+                    batch.delete_item(Key={'gram': item['gram'], 'license_id': item['license_id']})
+                    dropped += 1
+
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            scan_kwargs['ExclusiveStartKey'] = last_key
+
+    print(f"Dropped {dropped} short-gram postings from {search_table.name}")
+    return dropped
+
+if __name__ == '__main__':
+    licenses_table_name = sys.argv[1] if len(sys.argv) > 1 else 'licenses'
+    rebuild(table(licenses_table_name), table(SEARCH_INDEX_TABLE))
+    drop_short_grams(table(SEARCH_INDEX_TABLE))
@@ -0,0 +1,139 @@
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+from aws_runtime import table
+from boto3.dynamodb.conditions import Attr
+from expiry_index import EXPIRY_INDEX_NAME, count_expiring, lookback_start
+
+# Single aggregate item read by the dashboard instead of scanning both tables
+STATS_TABLE = os.getenv("STATS_TABLE", "app_stats")
+STATS_KEY = {'stat_id': 'dashboard'}
+
+COUNTERS = ('total_users', 'admin_count', 'total_licenses', 'expiring_soon')
+# Bumped by every write that goes through this module, so it changes whenever the
+# licenses or users change; the dashboard derives its ETag from it
+VERSION = 'version'
+
+EXPIRING_SOON_DAYS = 30
+
+def get_stats(stats_table):
+    item = stats_table.get_item(Key=STATS_KEY, ConsistentRead=True).get('Item', {})
+    return {counter: int(item.get(counter, 0)) for counter in COUNTERS + (VERSION,)}
+
+def version_deltas(deltas):
+    # The non-zero deltas, plus the version bump every write carries
+    return {**{counter: delta for counter, delta in deltas.items() if delta}, VERSION: 1}
+
+def increment(stats_table, **deltas):
+    # Atomic ADD of the non-zero deltas and the version; returns the updated counters.
+    # Called with no deltas, it only records that the data changed.
+    deltas = version_deltas(deltas)
+    response = stats_table.update_item(
+        Key=STATS_KEY,
+        UpdateExpression='ADD ' + ', '.join(f'#{counter} :{counter}' for counter in deltas),
+        ExpressionAttributeNames={f'#{counter}': counter for counter in deltas},
+        ExpressionAttributeValues={f':{counter}': Decimal(delta) for counter, delta in deltas.items()},
+        ReturnValues='UPDATED_NEW'
+    )
+    return {k: int(v) for k, v in response.get('Attributes', {}).items()}
+
+def increment_op(stats_table, condition=None, condition_values=None, **deltas):
+    # The same ADD as increment(), as a TransactWriteItems entry (resource-style values);
+    # condition may reference the counters as #name and its values as :name
+    deltas = version_deltas(deltas)
+    update = {
+        'TableName': stats_table.name,
+        'Key': STATS_KEY,
+        'UpdateExpression': 'ADD ' + ', '.join(f'#{counter} :{counter}' for counter in deltas),
+        'ExpressionAttributeNames': {f'#{counter}': counter for counter in deltas},
+        'ExpressionAttributeValues': {f':{counter}': Decimal(delta) for counter, delta in deltas.items()}
+    }
+    if condition:
+        update['ConditionExpression'] = condition
+        update['ExpressionAttributeValues'].update(condition_values or {})
+    return {'Update': update}
+
+def is_expiring_soon(expiry_str, today=None):
+    # Same window the expiry index counts: lookback start .. today + 30 days
+    today = today or datetime.today().date()
+    try:
+        expiry = datetime.strptime(expiry_str, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return False
+    if EXPIRY_INDEX_NAME and expiry < lookback_start(today):
+        return False
+    return (expiry - today).days <= EXPIRING_SOON_DAYS
+
+def expiring_delta(old_expiry, new_expiry, today=None):
+    return int(is_expiring_soon(new_expiry, today)) - int(is_expiring_soon(old_expiry, today))
+
+def count_expiring_soon(licenses_table, today):
+    end = today + timedelta(days=EXPIRING_SOON_DAYS)
+    if EXPIRY_INDEX_NAME:
+        return count_expiring(licenses_table, lookback_start(today), end)
+
+    scan_kwargs = {'Select': 'COUNT', 'FilterExpression': Attr('expiry_date').lte(end.isoformat())}
+    count = 0
+    while True:
+        response = licenses_table.scan(**scan_kwargs)
+        count += response.get('Count', 0)
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return count
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+def roll_over(stats_table, licenses_table, today):
+    # expiring_soon depends on the date, so the daily tracker run resets it
+    expiring_soon = count_expiring_soon(licenses_table, today)
+    stats_table.update_item(
+        Key=STATS_KEY,
+        UpdateExpression='SET expiring_soon = :count, expiring_soon_as_of = :today ADD #version :one',
+        ExpressionAttributeNames={'#version': VERSION},
+        ExpressionAttributeValues={':count': expiring_soon, ':today': today.isoformat(), ':one': 1}
+    )
+    print(f"Rolled over expiring_soon to {expiring_soon} for {today}")
+    return expiring_soon
+
+def scan_all(table, **scan_kwargs):
+    while True:
+        response = table.scan(**scan_kwargs)
+        yield from response.get('Items', [])
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        scan_kwargs['ExclusiveStartKey'] = last_key
+
+def rebuild(stats_table, users_table, licenses_table):
+    # Recounts everything from scratch; used to seed or repair the stats item
+    today = datetime.today().date()
+    total_users = admin_count = 0
+    for user in scan_all(users_table, ProjectionExpression='#r', ExpressionAttributeNames={'#r': 'role'}):
+        total_users += 1
+        admin_count += user.get('role') == 'admin'
+
+    total_licenses = expiring_soon = 0
+    for lic in scan_all(licenses_table, ProjectionExpression='expiry_date'):
+        total_licenses += 1
+        expiring_soon += is_expiring_soon(lic.get('expiry_date'), today)
+
+    stats_table.update_item(
+        Key=STATS_KEY,
+        UpdateExpression='SET total_users = :users, admin_count = :admins, total_licenses = :licenses, '
+                         'expiring_soon = :expiring, expiring_soon_as_of = :today ADD #version :one',
+        ExpressionAttributeNames={'#version': VERSION},
+        ExpressionAttributeValues={
+            ':one': 1,
+            ':users': total_users,
+            ':admins': admin_count,
+            ':licenses': total_licenses,
+            ':expiring': expiring_soon,
+            ':today': today.isoformat()
+        }
+    )
+    print(f"Rebuilt stats: {total_users} users, {admin_count} admins, "
+          f"{total_licenses} licenses, {expiring_soon} expiring soon")
+
+if __name__ == '__main__':
+    rebuild(table(STATS_TABLE), table('users'), table('licenses'))